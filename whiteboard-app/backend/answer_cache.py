@@ -0,0 +1,113 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+
+class AnswerCache:
+    """
+    Cache of final RAG answers.
+
+    A question first matches on the hash of its normalized text; failing that,
+    on cosine similarity of its embedding against earlier questions in the
+    same scope. Entries expire after `ttl_s`, the least recently used are
+    evicted past `max_entries`, and everything is dropped whenever the corpus
+    version changes so answers never outlive the documents they came from.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_s: float = 3600, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.similarity_threshold = similarity_threshold
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(scope: str, question: str) -> str:
+        digest = hashlib.sha256(normalize_text(question).lower().encode("utf-8")).hexdigest()
+        return f"{scope}:{digest}"
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _sync_version(self, version: int) -> bool:
+        """Advance to a newer corpus version; False if `version` is already stale."""
+        if self._version is None or version > self._version:
+            self._entries.clear()
+            self._version = version
+        return version == self._version
+
+    def _expire(self, now: float):
+        expired = [k for k, e in self._entries.items() if now - e["created"] > self.ttl_s]
+        for k in expired:
+            del self._entries[k]
+
+    def lookup(self, question: str, version: int, scope: str = "", query_vector=None) -> Optional[dict]:
+        """Return a cached result for the question, or None. Pass query_vector to allow semantic matches."""
+        now = time.monotonic()
+        with self._lock:
+            if not self._sync_version(version):
+                self.misses += 1
+                return None
+            self._expire(now)
+
+            key = self._key(scope, question)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["result"]
+
+            if query_vector is not None:
+                candidates = [(k, e) for k, e in self._entries.items() if e["scope"] == scope and e["vector"] is not None]
+                if candidates:
+                    matrix = np.stack([e["vector"] for _, e in candidates])
+                    scores = matrix @ self._unit(query_vector)
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity_threshold:
+                        best_key = candidates[best][0]
+                        self._entries.move_to_end(best_key)
+                        self.semantic_hits += 1
+                        return candidates[best][1]["result"]
+
+            self.misses += 1
+            return None
+
+    def store(self, question: str, version: int, result: dict, scope: str = "", query_vector=None):
+        with self._lock:
+            # An answer computed against an older corpus must not be served
+            if not self._sync_version(version):
+                return
+            key = self._key(scope, question)
+            self._entries[key] = {
+                "scope": scope,
+                "created": time.monotonic(),
+                "vector": self._unit(query_vector) if query_vector is not None else None,
+                "result": result,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "corpus_version": self._version,
+            }
@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from queue import Empty, Full, Queue
+from typing import Iterator, Optional
+
+from jose import jwt, JWTError
+from supabase import create_client, Client
+
+logger = logging.getLogger(__name__)
+
+
+class AuthError(Exception):
+    pass
+
+
+@dataclass
+class AuthUser:
+    id: str
+    email: Optional[str] = None
+    role: Optional[str] = None
+    expires_at: Optional[float] = None
+    claims: dict = field(default_factory=dict)
+
+
+class VerifiedTokenCache:
+    """TTL-bounded LRU of tokens that already passed verification, keyed by token hash."""
+
+    def __init__(self, max_entries: int = 10000, ttl_s: float = 300):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict[str, tuple[float, AuthUser]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[AuthUser]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token: str, user: AuthUser):
+        expires = time.time() + self.ttl_s
+        # Never trust a cached token past its own expiry
+        if user.expires_at is not None:
+            expires = min(expires, user.expires_at)
+        with self._lock:
+            self._entries[self._key(token)] = (expires, user)
+            self._entries.move_to_end(self._key(token))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SupabaseClientPool:
+    """
+    Free list of Supabase clients. A client is checked out for the length of
+    one request, so the per-request auth header set on it is never shared.
+    """
+
+    def __init__(self, url: str, key: str, max_idle: int = 16):
+        self.url = url
+        self.key = key
+        self._idle: Queue = Queue(maxsize=max_idle)
+
+    @contextmanager
+    def client(self, token: Optional[str] = None) -> Iterator[Client]:
+        try:
+            client = self._idle.get_nowait()
+        except Empty:
+            client = create_client(self.url, self.key)
+        if token:
+            client.postgrest.auth(token)
+        try:
+            yield client
+        finally:
+            try:
+                self._idle.put_nowait(client)
+            except Full:
+                pass
+
+
+class Authenticator:
+    """
+    Verifies Supabase access tokens. With a JWT secret the signature, expiry
+    and audience are checked locally; otherwise the Supabase Auth API is asked.
+    Either way successful verifications are cached until the token expires or
+    the cache TTL runs out.
+    """
+
+    def __init__(
+        self,
+        pool: SupabaseClientPool,
+        jwt_secret: Optional[str] = None,
+        audience: str = "authenticated",
+        cache: Optional[VerifiedTokenCache] = None,
+    ):
+        self.pool = pool
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self.cache = cache or VerifiedTokenCache()
+
+    def _verify_local(self, token: str) -> AuthUser:
+        try:
+            claims = jwt.decode(token, self.jwt_secret, algorithms=["HS256"], audience=self.audience)
+        except JWTError as e:
+            raise AuthError(str(e))
+        if not claims.get("sub"):
+            raise AuthError("Token has no subject")
+        return AuthUser(
+            id=claims["sub"],
+            email=claims.get("email"),
+            role=claims.get("role"),
+            expires_at=claims.get("exp"),
+            claims=claims,
+        )
+
+    def _verify_remote(self, token: str) -> AuthUser:
+        with self.pool.client() as client:
+            user_response = client.auth.get_user(token)
+        if not user_response or not user_response.user:
+            raise AuthError("Invalid token")
+        user = user_response.user
+        expires_at = None
+        try:
+            # Signature is not checked here; the claim only bounds how long we cache
+            expires_at = jwt.get_unverified_claims(token).get("exp")
+        except JWTError:
+            pass
+        return AuthUser(id=user.id, email=user.email, role=user.role, expires_at=expires_at)
+
+    def verify(self, token: str) -> AuthUser:
+        user = self.cache.get(token)
+        if user is not None:
+            return user
+        user = self._verify_local(token) if self.jwt_secret else self._verify_remote(token)
+        self.cache.put(token, user)
+        return user
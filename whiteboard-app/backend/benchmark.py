@@ -0,0 +1,420 @@
+"""
+Offline benchmark for the ingest and query paths.
+
+Everything runs in-process with no network: Cohere is replaced by a
+deterministic hashing embedder, Groq by a canned answer, and the vector store
+is local-mode Qdrant (in memory) or the NumPy backend in a temp directory.
+Synthetic PDFs are generated per run, so results are reproducible for a given
+seed and size.
+
+    python benchmark.py --docs 4 --pages 50 --queries 200 --concurrency 16 --output run.json
+    python benchmark.py --compare baseline.json run.json
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import math
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+DIM = 1024
+
+_WORDS = (
+    "vector index query chunk embedding document retrieval context answer model page section "
+    "cosine recall latency throughput memory token budget cache tenant payload filter batch "
+    "graph node edge layer quantization score rank source whiteboard lecture exam study notes"
+).split()
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def latency_summary(latencies_ms: list[float], elapsed_s: float) -> dict:
+    return {
+        "count": len(latencies_ms),
+        "throughput_per_s": round(len(latencies_ms) / elapsed_s, 2) if elapsed_s else 0.0,
+        "mean_ms": round(statistics.fmean(latencies_ms), 3) if latencies_ms else 0.0,
+        "p50_ms": round(percentile(latencies_ms, 50), 3),
+        "p95_ms": round(percentile(latencies_ms, 95), 3),
+        "p99_ms": round(percentile(latencies_ms, 99), 3),
+        "max_ms": round(max(latencies_ms), 3) if latencies_ms else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def record_rss(stage_result: dict, peak_before: float) -> float:
+    """
+    Store the process peak RSS after a stage and how much that stage raised it.
+    The peak never goes down, so a stage that stays under an earlier peak shows 0 growth.
+    """
+    peak = peak_rss_mb()
+    stage_result["peak_rss_mb_so_far"] = peak
+    stage_result["peak_rss_growth_mb"] = round(peak - peak_before, 1)
+    return peak
+
+
+# --- Synthetic inputs ---
+
+def synthetic_sentences(rng: random.Random, count: int) -> list[str]:
+    sentences = []
+    for _ in range(count):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 20))]
+        sentences.append(" ".join(words).capitalize() + ".")
+    return sentences
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_synthetic_pdf(path: Path, pages: int, words_per_page: int, rng: random.Random):
+    """Write a text-only PDF with `pages` pages of roughly `words_per_page` words each."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for _ in range(pages):
+        lines, line, words = [], [], 0
+        while words < words_per_page:
+            for word in rng.choice(synthetic_sentences(rng, 4)).split():
+                line.append(word)
+                words += 1
+                if len(line) == 12:
+                    lines.append(" ".join(line))
+                    line = []
+        if line:
+            lines.append(" ".join(line))
+        text_ops = "".join(f"({_pdf_escape(l)}) Tj T* " for l in lines[:60])
+        stream = f"BT /F1 9 Tf 11 TL 40 800 Td {text_ops}ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+
+# --- Stubs for the remote services ---
+
+def hashing_embedder(latency_ms: float):
+    """Deterministic bag-of-words embedding; similar texts get similar vectors, so search results are meaningful."""
+
+    def _embed(texts: list[str], input_type: str) -> list[list[float]]:
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        vectors = []
+        for text in texts:
+            vec = [0.0] * DIM
+            for word in text.lower().split():
+                digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+                index = int.from_bytes(digest[:4], "little") % DIM
+                vec[index] += 1.0 if digest[4] & 1 else -1.0
+            norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+            vectors.append([v / norm for v in vec])
+        return vectors
+
+    return _embed
+
+
+def canned_llm(latency_ms: float):
+    async def _answer(user_content: str) -> str:
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        return f"Stub answer from {len(user_content)} characters of context."
+
+    return _answer
+
+
+# --- Run ---
+
+def configure_environment(args, workdir: Path):
+    # config.py reads these at import time, so they must be set before any backend import
+    os.environ.update({
+        "VECTOR_BACKEND": args.backend,
+        "NUMPY_STORE_PATH": str(workdir / "vector_store"),
+        "RAG_QUERY_MODE": "direct",
+        "ANSWER_CACHE_ENABLED": "false",
+        "EMBED_CACHE_ENABLED": "true" if args.embed_cache else "false",
+        "EMBED_CACHE_PATH": "",
+        "INGEST_MANIFEST_PATH": "",
+        # Never touch the shared version file a running server watches
+        "CORPUS_VERSION_PATH": str(workdir / "corpus_version.sqlite3"),
+        "VECTOR_TENANCY": "shared",
+    })
+    for name in ("COHERE_API_KEY", "GROQ_API_KEY", "SUPABASE_ANON_KEY"):
+        os.environ.setdefault(name, "offline-benchmark")
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+
+
+def bench_parse(pdfs: list[Path]) -> tuple[dict, dict[str, list[str]]]:
+    from data_loader import count_pdf_pages, load_and_chunk_pdf
+
+    chunks_by_source = {}
+    pages = 0
+    start = time.perf_counter()
+    for pdf in pdfs:
+        pages += count_pdf_pages(str(pdf))
+        chunks_by_source[pdf.name] = load_and_chunk_pdf(str(pdf))
+    elapsed = time.perf_counter() - start
+    chunks = sum(len(c) for c in chunks_by_source.values())
+    return {
+        "documents": len(pdfs),
+        "pages": pages,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "pages_per_s": round(pages / elapsed, 2),
+        "chunks_per_s": round(chunks / elapsed, 2),
+    }, chunks_by_source
+
+
+def bench_embed(chunks_by_source: dict[str, list[str]]) -> tuple[dict, dict[str, list[list[float]]]]:
+    from data_loader import embed_texts
+
+    vectors_by_source = {}
+    start = time.perf_counter()
+    for source, chunks in chunks_by_source.items():
+        vectors_by_source[source] = embed_texts(chunks)
+    elapsed = time.perf_counter() - start
+    chunks = sum(len(v) for v in vectors_by_source.values())
+    return {"chunks": chunks, "seconds": round(elapsed, 3), "chunks_per_s": round(chunks / elapsed, 2)}, vectors_by_source
+
+
+def bench_upsert(storage, chunks_by_source, vectors_by_source, user_id: str) -> dict:
+    from ingest import chunk_payload, point_ids
+
+    points = 0
+    start = time.perf_counter()
+    for source, chunks in chunks_by_source.items():
+        ids = point_ids(source, chunks, user_id)
+        payloads = [chunk_payload(source, i, c, user_id) for i, c in enumerate(chunks)]
+        storage.bulk_upsert(ids, vectors_by_source[source], payloads)
+        points += len(ids)
+    elapsed = time.perf_counter() - start
+    return {"points": points, "seconds": round(elapsed, 3), "points_per_s": round(points / elapsed, 2)}
+
+
+def bench_search(storage, query_vectors: list[list[float]], top_k: int, user_id: str) -> dict:
+    latencies = []
+    start = time.perf_counter()
+    for vector in query_vectors:
+        mark = time.perf_counter()
+        storage.search(vector, top_k, user_id=user_id)
+        latencies.append((time.perf_counter() - mark) * 1000)
+    return latency_summary(latencies, time.perf_counter() - start)
+
+
+async def bench_query(questions: list[str], top_k: int, concurrency: int, user_id: str) -> dict:
+    """Drive POST /api/rag/query through the ASGI app with `concurrency` requests in flight."""
+    import httpx
+    import main
+    from auth import AuthUser
+
+    main.app.dependency_overrides[main.get_supabase_client] = lambda: (None, AuthUser(id=user_id))
+    transport = httpx.ASGITransport(app=main.app)
+    latencies, errors = [], 0
+    pending = iter(questions)
+
+    async def _worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for question in pending:
+            mark = time.perf_counter()
+            response = await client.post("/api/rag/query", json={"question": question, "top_k": top_k})
+            latencies.append((time.perf_counter() - mark) * 1000)
+            errors += response.status_code != 200
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        # One warm-up request so first-use setup is not counted
+        await client.post("/api/rag/query", json={"question": questions[0], "top_k": top_k})
+        start = time.perf_counter()
+        await asyncio.gather(*(_worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return {**latency_summary(latencies, elapsed), "concurrency": concurrency, "errors": errors}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def run(args) -> dict:
+    if args.keep_workdir:
+        workdir = Path(tempfile.mkdtemp(prefix="rag-bench-"))
+        print(f"Keeping benchmark files in {workdir}", file=sys.stderr)
+        return run_in(args, workdir)
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as workdir:
+        return run_in(args, Path(workdir))
+
+
+def run_in(args, workdir: Path) -> dict:
+    configure_environment(args, workdir)
+    rng = random.Random(args.seed)
+
+    import data_loader
+    import rag_pipeline
+    import vector_db
+
+    data_loader._embed_remote = hashing_embedder(args.embed_latency_ms)
+    rag_pipeline.llm_answer_async = canned_llm(args.llm_latency_ms)
+
+    if args.backend == "qdrant":
+        # Local-mode client in place of the server; queries share it through the thread pool
+        from qdrant_client import QdrantClient
+        vector_db._clients[vector_db.QDRANT_URL] = QdrantClient(":memory:")
+    storage = vector_db.get_storage()
+    vector_db._async_storages[(vector_db.QDRANT_URL, vector_db.QDRANT_COLLECTION)] = vector_db._ThreadedAsyncStorage(storage)
+
+    pdfs = []
+    for i in range(args.docs):
+        pdf = workdir / f"synthetic-{i:03d}.pdf"
+        write_synthetic_pdf(pdf, args.pages, args.words_per_page, rng)
+        pdfs.append(pdf)
+    questions = [rng.choice(synthetic_sentences(rng, 8)).rstrip(".") + "?" for _ in range(args.queries)]
+
+    results = {}
+    peak = peak_rss_mb()
+    results["parse"], chunks_by_source = bench_parse(pdfs)
+    peak = record_rss(results["parse"], peak)
+    results["embed"], vectors_by_source = bench_embed(chunks_by_source)
+    peak = record_rss(results["embed"], peak)
+    results["upsert"] = bench_upsert(storage, chunks_by_source, vectors_by_source, args.user_id)
+    peak = record_rss(results["upsert"], peak)
+    query_vectors = data_loader.embed_texts(questions, "search_query")
+    peak = peak_rss_mb()
+    results["search"] = bench_search(storage, query_vectors, args.top_k, args.user_id)
+    peak = record_rss(results["search"], peak)
+    results["query"] = asyncio.run(bench_query(questions, args.top_k, args.concurrency, args.user_id))
+    record_rss(results["query"], peak)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "params": {
+            k: getattr(args, k) for k in (
+                "backend", "docs", "pages", "words_per_page", "queries", "concurrency", "top_k",
+                "embed_latency_ms", "llm_latency_ms", "embed_cache", "seed",
+            )
+        },
+        "results": results,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# Metrics compared between runs, and whether a higher value is better
+COMPARED = {
+    "parse.pages_per_s": True,
+    "parse.chunks_per_s": True,
+    "embed.chunks_per_s": True,
+    "upsert.points_per_s": True,
+    "search.p50_ms": False,
+    "search.p99_ms": False,
+    "query.throughput_per_s": True,
+    "query.p50_ms": False,
+    "query.p95_ms": False,
+    "query.p99_ms": False,
+}
+
+
+def compare(baseline: dict, current: dict) -> list[dict]:
+    rows = []
+    for metric, higher_is_better in COMPARED.items():
+        stage, key = metric.split(".")
+        before = baseline["results"].get(stage, {}).get(key)
+        after = current["results"].get(stage, {}).get(key)
+        if not before or after is None:
+            continue
+        change = (after - before) / before * 100
+        rows.append({
+            "metric": metric,
+            "baseline": before,
+            "current": after,
+            "change_pct": round(change, 1),
+            "regressed": change < 0 if higher_is_better else change > 0,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingest and query benchmark with stubbed embedder and LLM")
+    parser.add_argument("--backend", choices=["qdrant", "numpy"], default="qdrant")
+    parser.add_argument("--docs", type=int, default=4, help="Synthetic PDFs to generate")
+    parser.add_argument("--pages", type=int, default=25, help="Pages per PDF")
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--queries", type=int, default=200, help="Requests sent to /api/rag/query")
+    parser.add_argument("--concurrency", type=int, default=16, help="Query requests in flight")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Simulated latency per embed call")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated latency per LLM call")
+    parser.add_argument("--embed-cache", action="store_true", help="Keep the in-memory embedding cache enabled")
+    parser.add_argument("--user-id", default="benchmark-user")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the generated PDFs and vector store on disk")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two saved reports and exit")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="Percent change --compare tolerates before exiting 1")
+    args = parser.parse_args()
+
+    if args.compare:
+        baseline, current = (json.loads(Path(p).read_text()) for p in args.compare)
+        rows = compare(baseline, current)
+        print(json.dumps(rows, indent=2))
+        sys.exit(1 if any(row["regressed"] and abs(row["change_pct"]) > args.tolerance for row in rows) else 0)
+
+    # The app logs to stdout; keep it clean for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
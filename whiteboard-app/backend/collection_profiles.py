@@ -0,0 +1,163 @@
+import dataclasses
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Disabled,
+    Distance,
+    HnswConfigDiff,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams,
+    VectorParamsDiff,
+)
+
+from config import (
+    QDRANT_PROFILE,
+    QDRANT_HNSW_M,
+    QDRANT_HNSW_EF_CONSTRUCT,
+    QDRANT_SEARCH_EF,
+    QDRANT_OVERSAMPLING,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    """
+    Storage and search settings for a Qdrant collection.
+
+    With quantization the compressed vectors stay in RAM for the HNSW walk
+    while the float32 originals can live on disk. Queries fetch
+    `oversampling * top_k` candidates by compressed score and rescore them
+    against the originals, which recovers most of the recall lost to
+    compression.
+    """
+
+    name: str
+    quantization: Optional[str] = None  # None, "scalar" (int8) or "binary" (1 bit per dimension)
+    on_disk: bool = False
+    hnsw_m: Optional[int] = None
+    hnsw_ef_construct: Optional[int] = None
+    search_ef: Optional[int] = None
+    oversampling: Optional[float] = None
+    rescore: bool = True
+
+    def vectors_config(self, dim: int) -> VectorParams:
+        return VectorParams(size=dim, distance=Distance.COSINE, on_disk=self.on_disk or None)
+
+    def hnsw_config(self) -> Optional[HnswConfigDiff]:
+        if self.hnsw_m is None and self.hnsw_ef_construct is None:
+            return None
+        return HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def quantization_config(self):
+        if self.quantization == "scalar":
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+            )
+        if self.quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def search_params(self) -> Optional[SearchParams]:
+        quantization = None
+        if self.quantization:
+            quantization = QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling)
+        if quantization is None and self.search_ef is None:
+            return None
+        return SearchParams(hnsw_ef=self.search_ef, quantization=quantization)
+
+    def bytes_per_vector_in_ram(self, dim: int) -> int:
+        """Rough RAM per point for vectors alone, excluding the HNSW graph and payloads."""
+        original = 0 if self.on_disk else dim * 4
+        if self.quantization == "scalar":
+            return original + dim
+        if self.quantization == "binary":
+            return original + dim // 8
+        return original
+
+
+PROFILES = {
+    "default": CollectionProfile("default"),
+    # ~4x less vector RAM; int8 keeps recall close to float32 with light oversampling
+    "scalar": CollectionProfile("scalar", quantization="scalar", on_disk=True, oversampling=2.0),
+    # ~32x less vector RAM; Cohere v3 embeddings hold up well under binary codes with heavier oversampling
+    "binary": CollectionProfile("binary", quantization="binary", on_disk=True, oversampling=3.0),
+}
+
+
+def get_profile(name: str = QDRANT_PROFILE) -> CollectionProfile:
+    """Named profile with any QDRANT_HNSW_* / QDRANT_SEARCH_EF / QDRANT_OVERSAMPLING overrides applied."""
+    if name not in PROFILES:
+        raise ValueError(f"Unknown collection profile '{name}', expected one of {sorted(PROFILES)}")
+    overrides = {
+        "hnsw_m": QDRANT_HNSW_M,
+        "hnsw_ef_construct": QDRANT_HNSW_EF_CONSTRUCT,
+        "search_ef": QDRANT_SEARCH_EF,
+        "oversampling": QDRANT_OVERSAMPLING,
+    }
+    return dataclasses.replace(PROFILES[name], **{k: v for k, v in overrides.items() if v is not None})
+
+
+def tenant_collections(client: QdrantClient, collection: str) -> list[str]:
+    """`collection` and every per-user collection created from it (see vector_db.tenant_collection)."""
+    names = [c.name for c in client.get_collections().collections]
+    return sorted(name for name in names if name == collection or name.startswith(f"{collection}_"))
+
+
+def migrate_collection(client: QdrantClient, collection: str, profile: CollectionProfile) -> None:
+    """
+    Switch an existing collection to `profile` in place. Qdrant re-encodes
+    vectors and rebuilds the index in the background; searches keep working
+    throughout.
+    """
+    quantization = profile.quantization_config() or Disabled.DISABLED
+    client.update_collection(
+        collection_name=collection,
+        vectors_config={"": VectorParamsDiff(on_disk=profile.on_disk, hnsw_config=profile.hnsw_config())},
+        quantization_config=quantization,
+    )
+    info = client.get_collection(collection)
+    ram_mb = profile.bytes_per_vector_in_ram(info.config.params.vectors.size) * (info.points_count or 0) / 1024 ** 2
+    logger.info(
+        f"Migrated collection '{collection}' to profile '{profile.name}' "
+        f"({info.points_count or 0} points, ~{ram_mb:.1f} MB of vectors in RAM once re-encoded)"
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from config import QDRANT_COLLECTION
+    from vector_db import get_qdrant_client
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Apply a storage profile to existing Qdrant collections")
+    parser.add_argument("profile", choices=sorted(PROFILES))
+    parser.add_argument("--collection", default=QDRANT_COLLECTION)
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Also migrate every per-user collection named '<collection>_<user_id>'",
+    )
+    args = parser.parse_args()
+
+    client = get_qdrant_client()
+    profile = get_profile(args.profile)
+    collections = tenant_collections(client, args.collection) if args.all else [args.collection]
+    for collection in collections:
+        migrate_collection(client, collection, profile)
+        info = client.get_collection(collection)
+        print(f"{collection}: status={info.status} points={info.points_count}")
+        print(f"  vectors={info.config.params.vectors}")
+        print(f"  quantization={info.config.quantization_config}")
+    print(f"Migrated {len(collections)} collection(s) to profile '{profile.name}'")
@@ -6,6 +6,11 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+# JWT secret from Supabase project settings; enables local token verification
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+AUTH_CACHE_TTL_S = float(os.getenv("AUTH_CACHE_TTL_S", "300"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+SUPABASE_CLIENT_POOL_SIZE = int(os.getenv("SUPABASE_CLIENT_POOL_SIZE", "16"))
 
 # CORS origins - add your frontend URL
 CORS_ORIGINS = [
@@ -13,3 +18,97 @@ CORS_ORIGINS = [
     "http://127.0.0.1:3000",
 ]
 
+# Embedding cache - in-memory LRU budget and on-disk SQLite store
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+EMBED_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "cache/embeddings.sqlite3")
+
+# Embedding engine - Cohere accepts at most 96 texts per embed call
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "96"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "4"))
+
+# Ingest mode - "streaming" walks the PDF in page windows, "batch" loads it whole
+INGEST_MODE = os.getenv("INGEST_MODE", "streaming")
+INGEST_PAGES_PER_STEP = int(os.getenv("INGEST_PAGES_PER_STEP", "25"))
+
+# Ingest process pool - PDF parsing and chunking run across cores
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 2)))
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "5"))
+
+# Ingest manifest - file hash of each fully ingested document (empty disables skipping unchanged files)
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "cache/ingest_manifest.sqlite3")
+
+# Qdrant - one pooled client per process; gRPC avoids per-request HTTP overhead
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "docs")
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "30"))
+
+# Collection profile - "default" (float32 in RAM), "scalar" (int8 + on-disk originals) or "binary"
+QDRANT_PROFILE = os.getenv("QDRANT_PROFILE", "default")
+# Optional overrides; unset keeps the profile's (or Qdrant's) value
+QDRANT_HNSW_M = int(os.environ["QDRANT_HNSW_M"]) if os.getenv("QDRANT_HNSW_M") else None
+QDRANT_HNSW_EF_CONSTRUCT = int(os.environ["QDRANT_HNSW_EF_CONSTRUCT"]) if os.getenv("QDRANT_HNSW_EF_CONSTRUCT") else None
+QDRANT_SEARCH_EF = int(os.environ["QDRANT_SEARCH_EF"]) if os.getenv("QDRANT_SEARCH_EF") else None
+QDRANT_OVERSAMPLING = float(os.environ["QDRANT_OVERSAMPLING"]) if os.getenv("QDRANT_OVERSAMPLING") else None
+
+# Bulk upsert - points per request, requests in flight, and whether to wait for indexing
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "256"))
+UPSERT_MAX_CONCURRENCY = int(os.getenv("UPSERT_MAX_CONCURRENCY", "4"))
+UPSERT_WAIT = os.getenv("UPSERT_WAIT", "true").lower() == "true"
+
+# Vector backend - "qdrant" or "numpy" (embedded memory-mapped store, no server needed)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+NUMPY_STORE_PATH = os.getenv("NUMPY_STORE_PATH", "vector_store")
+NUMPY_STORE_QUANTIZED = os.getenv("NUMPY_STORE_QUANTIZED", "false").lower() == "true"
+# Rewrite the store once this share of payload lines is superseded or deleted
+NUMPY_STORE_COMPACT_RATIO = float(os.getenv("NUMPY_STORE_COMPACT_RATIO", "0.5"))
+
+# Tenancy - "shared" keeps one collection filtered by user_id; "collection" gives each user their own
+VECTOR_TENANCY = os.getenv("VECTOR_TENANCY", "shared")
+
+# Context packing - prompt token budget for retrieved context (0 = unlimited)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+# Answer cache - repeated or near-identical questions skip retrieval and the LLM
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+# Corpus version shared by every process on this host (empty keeps it per process)
+CORPUS_VERSION_PATH = os.getenv("CORPUS_VERSION_PATH", "cache/corpus_version.sqlite3")
+
+# Result broker - empty URL keeps results in-process; a redis:// URL shares them across workers
+RESULT_BROKER_URL = os.getenv("RESULT_BROKER_URL", "")
+RESULT_TTL_S = float(os.getenv("RESULT_TTL_S", "600"))
+RAG_QUERY_TIMEOUT_S = float(os.getenv("RAG_QUERY_TIMEOUT_S", "60"))
+
+# Query execution - "inngest" dispatches an event and waits, "direct" runs the pipeline in the request
+RAG_QUERY_MODE = os.getenv("RAG_QUERY_MODE", "inngest")
+
+# Batch queries - questions per request and concurrent LLM completions per batch
+RAG_BATCH_MAX_QUESTIONS = int(os.getenv("RAG_BATCH_MAX_QUESTIONS", "50"))
+RAG_BATCH_LLM_CONCURRENCY = int(os.getenv("RAG_BATCH_LLM_CONCURRENCY", "8"))
+
+# Whiteboard GET - cache of serialized bodies and minimum size worth compressing
+WHITEBOARD_BODY_CACHE_MAX_BYTES = int(os.getenv("WHITEBOARD_BODY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+
+# Whiteboard write buffer - merge autosaves per board and flush on interval or merged-save count
+WRITE_BUFFER_ENABLED = os.getenv("WRITE_BUFFER_ENABLED", "false").lower() == "true"
+WRITE_BUFFER_FLUSH_INTERVAL_S = float(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL_S", "2.0"))
+WRITE_BUFFER_MAX_MERGED_SAVES = int(os.getenv("WRITE_BUFFER_MAX_MERGED_SAVES", "50"))
+
+# Uploads - stored by content hash; copied in fixed-size chunks off the event loop
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Allowance for multipart framing when checking Content-Length against UPLOAD_MAX_BYTES
+UPLOAD_FORM_OVERHEAD_BYTES = int(os.getenv("UPLOAD_FORM_OVERHEAD_BYTES", str(64 * 1024)))
+
+# Blocking-call pools - threads per dependency for SDKs without a native async client
+EXECUTOR_DB_WORKERS = int(os.getenv("EXECUTOR_DB_WORKERS", "16"))
+EXECUTOR_EMBED_WORKERS = int(os.getenv("EXECUTOR_EMBED_WORKERS", "8"))
+EXECUTOR_VECTOR_WORKERS = int(os.getenv("EXECUTOR_VECTOR_WORKERS", "8"))
+EXECUTOR_INGEST_WORKERS = int(os.getenv("EXECUTOR_INGEST_WORKERS", "2"))
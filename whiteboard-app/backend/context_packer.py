@@ -0,0 +1,110 @@
+from typing import Callable, Optional
+
+from llama_index.core.utils import get_tokenizer
+
+# Same tokenizer SentenceSplitter sizes chunks with, so budgets line up with chunk_size
+_tokenize = get_tokenizer()
+
+# Shortest shared prefix/suffix treated as splitter overlap rather than coincidence
+_MIN_OVERLAP_CHARS = 32
+
+
+def count_tokens(text: str) -> int:
+    return len(_tokenize(text))
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def join_overlapping(first: str, second: str) -> str:
+    """Concatenate two consecutive chunks, dropping the text `second` repeats from the end of `first`."""
+    probe = second[:_MIN_OVERLAP_CHARS]
+    if len(probe) == _MIN_OVERLAP_CHARS:
+        pos = first.find(probe)
+        while pos != -1:
+            tail = first[pos:]
+            if second.startswith(tail):
+                return first + second[len(tail):]
+            pos = first.find(probe, pos + 1)
+    return first + "\n" + second
+
+
+def _truncate(text: str, max_tokens: int, count: Callable[[str], int]) -> str:
+    tokens = count(text)
+    if tokens <= max_tokens:
+        return text
+    # Cut proportionally, then back off to a word boundary
+    cut = text[:max(int(len(text) * max_tokens / tokens), 0)]
+    if " " in cut:
+        cut = cut[:cut.rfind(" ")]
+    while cut and count(cut) > max_tokens:
+        cut = cut[:int(len(cut) * 0.9)]
+    return cut
+
+
+def pack_contexts(
+    hits: list[dict],
+    token_budget: Optional[int] = None,
+    count: Callable[[str], int] = count_tokens,
+) -> list[dict]:
+    """
+    Turn ranked search hits into prompt contexts.
+
+    Hits from the same source with consecutive `chunk` indices are merged into
+    one block with their splitter overlap removed, exact duplicates are
+    dropped, and blocks are then taken in order of their best-ranked hit until
+    `token_budget` is spent. A block that does not fit is skipped in favour of
+    smaller, lower-ranked ones; only the top block is ever truncated. Returns
+    dicts with `text`, `source` and `tokens`.
+    """
+    blocks = []
+    by_source: dict[str, list[tuple[int, int, str]]] = {}
+    seen = set()
+    for rank, hit in enumerate(hits):
+        text = hit.get("text") or ""
+        key = _normalize(text)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        chunk = hit.get("chunk")
+        if chunk is None:
+            blocks.append({"rank": rank, "source": hit.get("source", ""), "text": text})
+        else:
+            by_source.setdefault(hit.get("source", ""), []).append((chunk, rank, text))
+
+    for source, members in by_source.items():
+        members.sort()
+        run = [members[0]]
+        for member in members[1:]:
+            if member[0] == run[-1][0] + 1:
+                run.append(member)
+                continue
+            blocks.append(_merge_run(source, run))
+            run = [member]
+        blocks.append(_merge_run(source, run))
+
+    blocks.sort(key=lambda b: b["rank"])
+    packed = []
+    used = 0
+    for block in blocks:
+        # A block fully contained in an earlier one adds nothing
+        normalized = _normalize(block["text"])
+        if any(normalized in _normalize(p["text"]) for p in packed):
+            continue
+        tokens = count(block["text"])
+        if token_budget and used + tokens > token_budget:
+            if packed:
+                continue
+            block["text"] = _truncate(block["text"], token_budget, count)
+            tokens = count(block["text"])
+        packed.append({"text": block["text"], "source": block["source"], "tokens": tokens})
+        used += tokens
+    return packed
+
+
+def _merge_run(source: str, run: list[tuple[int, int, str]]) -> dict:
+    text = run[0][2]
+    for _, _, following in run[1:]:
+        text = join_overlapping(text, following)
+    return {"rank": min(rank for _, rank, _ in run), "source": source, "text": text}
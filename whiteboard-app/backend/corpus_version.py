@@ -0,0 +1,39 @@
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class CorpusVersionStore:
+    """
+    Corpus version counter kept in SQLite so every process writing to the
+    vector store (uvicorn workers, Inngest workers, `python ingest.py`) bumps
+    the same number the API reads before using the answer cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Another process may hold the write lock for a moment while it bumps
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._db.execute("pragma journal_mode=wal")
+        self._db.execute("pragma synchronous=normal")
+        self._db.execute("create table if not exists corpus_version (id integer primary key check (id = 1), version integer not null)")
+        self._db.execute("insert or ignore into corpus_version (id, version) values (1, 0)")
+        self._db.commit()
+        logger.info(f"Corpus version shared through '{path}'")
+
+    def get(self) -> int:
+        with self._lock:
+            return self._db.execute("select version from corpus_version where id = 1").fetchone()[0]
+
+    def bump(self) -> int:
+        with self._lock:
+            version = self._db.execute(
+                "update corpus_version set version = version + 1 where id = 1 returning version"
+            ).fetchone()[0]
+            self._db.commit()
+            return version
@@ -6,6 +6,8 @@ class RAGChunkAndSrc(pydantic.BaseModel):
 
 class RAGUpsertResult(pydantic.BaseModel):
     ingested: int
+    reused: int = 0
+    skipped: bool = False
 
 class RAGSearchResult(pydantic.BaseModel):
     contexts: list[str]
@@ -17,3 +19,14 @@ class RAGQueryResult(pydantic.BaseModel):
     num_contexts: int
 
 
+
+class RAGIngestCursor(pydantic.BaseModel):
+    source_id: str
+    total_pages: int
+    next_page: int = 0
+    chunk_offset: int = 0
+    ingested: int = 0
+    user_id: str = None
+    file_hash: str = None
+    reused: int = 0
+    skipped: bool = False
@@ -1,9 +1,24 @@
+import contextvars
 import os
+from typing import Iterable, Iterator, Optional
 from dotenv import load_dotenv
+from pypdf import PdfReader
 from llama_index.readers.file import PDFReader
 from llama_index.core.node_parser import SentenceSplitter
 import cohere
 
+from config import (
+    EMBED_CACHE_ENABLED,
+    EMBED_CACHE_MAX_BYTES,
+    EMBED_CACHE_PATH,
+    EMBED_BATCH_SIZE,
+    EMBED_MAX_CONCURRENCY,
+    EMBED_MAX_RETRIES,
+)
+from embedding_cache import EmbeddingCache, cache_key
+from embedding_engine import EmbeddingEngine
+from telemetry import span
+
 load_dotenv()
 
 # Cohere client for embeddings
@@ -12,22 +27,98 @@ client = cohere.Client(api_key=os.getenv("COHERE_API_KEY"))
 # Cohere embedding model - embed-english-v3.0 produces 1024 dimensions
 EMBED_MODEL = "embed-english-v3.0"
 
+# Content-addressed cache in front of Cohere; set EMBED_CACHE_PATH="" for memory only
+embedding_cache = (
+    EmbeddingCache(max_bytes=EMBED_CACHE_MAX_BYTES, path=EMBED_CACHE_PATH or None)
+    if EMBED_CACHE_ENABLED
+    else None
+)
+
 splitter = SentenceSplitter(chunk_size=1000, chunk_overlap=200)
 
 def load_and_chunk_pdf(path: str) -> list[str]:
-    docs = PDFReader().load_data(file=path)
+    with span("parse"):
+        docs = PDFReader().load_data(file=path)
     texts = [d.text for d in docs if getattr(d, "text", None)]
     chunks: list[str] = []
-    for t in texts:
-        chunks.extend(splitter.split_text(t))
+    with span("chunk"):
+        for t in texts:
+            chunks.extend(splitter.split_text(t))
     return chunks
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
+def count_pdf_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+def iter_pdf_pages(path: str, start_page: int = 0, end_page: Optional[int] = None) -> Iterator[tuple[int, str]]:
+    """Yield (page_number, text) one page at a time instead of loading the whole PDF."""
+    reader = PdfReader(path)
+    end_page = len(reader.pages) if end_page is None else min(end_page, len(reader.pages))
+    for page_number in range(start_page, end_page):
+        text = reader.pages[page_number].extract_text()
+        if text:
+            yield page_number, text
+
+def iter_pdf_chunks(path: str, start_page: int = 0, end_page: Optional[int] = None) -> Iterator[tuple[int, str]]:
+    """Yield (page_number, chunk) lazily, page by page."""
+    for page_number, text in iter_pdf_pages(path, start_page, end_page):
+        for chunk in splitter.split_text(text):
+            yield page_number, chunk
+
+def _embed_remote(texts: list[str], input_type: str) -> list[list[float]]:
     response = client.embed(
         texts=texts,
         model=EMBED_MODEL,
-        input_type="search_document",
+        input_type=input_type,
     )
     return response.embeddings
 
+# Metrics stage of the embed_texts call in progress; query-time callers pass "embed_query"
+_embed_stage: contextvars.ContextVar[str] = contextvars.ContextVar("embed_stage", default="embed_document")
+
+def _embed_batch(texts: list[str], input_type: str) -> list[list[float]]:
+    # Cache lookups are included; cache hit counts are exported separately
+    with span(_embed_stage.get()):
+        return _embed_cached(texts, input_type)
+
+def _embed_cached(texts: list[str], input_type: str) -> list[list[float]]:
+    if embedding_cache is None:
+        return _embed_remote(texts, input_type)
+
+    keys = [cache_key(EMBED_MODEL, input_type, t) for t in texts]
+    vectors = embedding_cache.get_many(keys)
+
+    # Embed each distinct missing text once
+    missing: dict[str, str] = {}
+    for key, text, vec in zip(keys, texts, vectors):
+        if vec is None and key not in missing:
+            missing[key] = text
+
+    if missing:
+        fresh = _embed_remote(list(missing.values()), input_type)
+        embedding_cache.put_many(list(missing.keys()), fresh)
+        by_key = dict(zip(missing.keys(), fresh))
+        vectors = [vec if vec is not None else by_key[key] for key, vec in zip(keys, vectors)]
+
+    return vectors
+
+# Splits large inputs into Cohere-sized batches embedded concurrently
+embedding_engine = EmbeddingEngine(
+    _embed_batch,
+    batch_size=EMBED_BATCH_SIZE,
+    max_concurrency=EMBED_MAX_CONCURRENCY,
+    max_retries=EMBED_MAX_RETRIES,
+)
+
+def embed_texts(
+    texts: list[str], input_type: str = "search_document", stage: str = "embed_document"
+) -> list[list[float]]:
+    """Embed texts; each batch's latency is recorded under `stage`."""
+    token = _embed_stage.set(stage)
+    try:
+        return embedding_engine.embed(texts, input_type)
+    finally:
+        _embed_stage.reset(token)
 
+def embed_text_batches(batches: Iterable[list[str]], input_type: str = "search_document") -> Iterator[list[list[float]]]:
+    """Embed a lazily produced stream of batches, yielding vectors batch by batch in order."""
+    return embedding_engine.embed_batches(batches, input_type)
@@ -0,0 +1,139 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different inputs share a cache entry."""
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+
+def cache_key(model: str, input_type: str, text: str) -> str:
+    """Content-addressed key for (model, input_type, normalized text)."""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{input_type}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache.
+
+    The memory tier is an LRU bounded by the total size of the stored float32
+    vectors. The disk tier is a SQLite table that survives restarts; disk hits
+    are promoted into memory.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.path = path
+        self._memory: OrderedDict[str, array] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("pragma journal_mode=wal")
+            self._db.execute(
+                "create table if not exists embeddings (key text primary key, vector blob not null)"
+            )
+            self._db.commit()
+            logger.info(f"Embedding cache persisted at '{path}'")
+
+    def get_many(self, keys: list[str]) -> list[Optional[list[float]]]:
+        """Look up keys, returning None for each miss."""
+        found: list[Optional[list[float]]] = [None] * len(keys)
+        disk_lookup: list[int] = []
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    found[i] = vec.tolist()
+                else:
+                    disk_lookup.append(i)
+
+            if disk_lookup and self._db is not None:
+                wanted = list({keys[i] for i in disk_lookup})
+                rows: dict[str, bytes] = {}
+                # Stay well under SQLite's bound-parameter limit
+                for start in range(0, len(wanted), 500):
+                    part = wanted[start:start + 500]
+                    placeholders = ",".join("?" * len(part))
+                    cur = self._db.execute(
+                        f"select key, vector from embeddings where key in ({placeholders})", part
+                    )
+                    rows.update(cur.fetchall())
+                for i in disk_lookup:
+                    blob = rows.get(keys[i])
+                    if blob is None:
+                        continue
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    self._put_memory(keys[i], vec)
+                    self.disk_hits += 1
+                    found[i] = vec.tolist()
+
+            self.misses += sum(1 for v in found if v is None)
+
+        return found
+
+    def put_many(self, keys: list[str], vectors: list[list[float]]) -> None:
+        """Store vectors in both tiers."""
+        if len(keys) != len(vectors):
+            raise ValueError("keys and vectors must have the same length")
+
+        with self._lock:
+            rows = []
+            for key, vector in zip(keys, vectors):
+                vec = array("f", vector)
+                self._put_memory(key, vec)
+                rows.append((key, vec.tobytes()))
+
+            if self._db is not None and rows:
+                self._db.executemany(
+                    "insert or replace into embeddings (key, vector) values (?, ?)", rows
+                )
+                self._db.commit()
+
+    def _put_memory(self, key: str, vec: array) -> None:
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old.itemsize * len(old)
+        self._memory[key] = vec
+        self._memory_bytes += vec.itemsize * len(vec)
+        while self._memory_bytes > self.max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.itemsize * len(evicted)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current memory usage."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
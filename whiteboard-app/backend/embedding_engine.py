@@ -0,0 +1,98 @@
+import contextvars
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+EmbedFn = Callable[[list[str], str], list[list[float]]]
+
+
+class EmbeddingEngine:
+    """
+    Splits embedding work into provider-sized batches and runs a bounded
+    number of them concurrently through a shared thread pool.
+
+    Each batch is retried on its own with exponential backoff and jitter, so a
+    transient failure only repeats that batch. Results are always returned in
+    input order.
+    """
+
+    def __init__(
+        self,
+        embed_fn: EmbedFn,
+        batch_size: int = 96,
+        max_concurrency: int = 4,
+        max_retries: int = 4,
+        backoff_s: float = 0.5,
+        max_backoff_s: float = 8.0,
+    ):
+        if batch_size < 1 or max_concurrency < 1:
+            raise ValueError("batch_size and max_concurrency must be at least 1")
+        self.embed_fn = embed_fn
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed")
+        # Batches a single stream may have in flight or awaiting pickup
+        self.window = max_concurrency * 2
+
+    def embed(self, texts: list[str], input_type: str = "search_document") -> list[list[float]]:
+        """Embed texts in batches, preserving input order."""
+        if not texts:
+            return []
+        if len(texts) <= self.batch_size:
+            return self._embed_batch(texts, input_type)
+
+        batches = (texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size))
+        vectors: list[list[float]] = []
+        for batch_vectors in self.embed_batches(batches, input_type):
+            vectors.extend(batch_vectors)
+        return vectors
+
+    def embed_batches(
+        self, batches: Iterable[list[str]], input_type: str = "search_document"
+    ) -> Iterator[list[list[float]]]:
+        """
+        Embed a stream of batches, yielding results in the order the batches
+        arrive. The input iterable is only pulled as slots free up, so callers
+        can feed a lazily produced stream without buffering it.
+        """
+        pending = []
+        try:
+            for batch in batches:
+                # Backpressure: wait on the oldest batch once the window is full
+                if len(pending) >= self.window:
+                    yield pending.pop(0).result()
+                # Carry context variables (trace id, metrics stage) into the pool thread
+                context = contextvars.copy_context()
+                pending.append(self._executor.submit(context.run, self._embed_batch, batch, input_type))
+                while pending and pending[0].done():
+                    yield pending.pop(0).result()
+            while pending:
+                yield pending.pop(0).result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _embed_batch(self, batch: list[str], input_type: str) -> list[list[float]]:
+        attempt = 0
+        while True:
+            try:
+                vectors = self.embed_fn(batch, input_type)
+                if len(vectors) != len(batch):
+                    raise RuntimeError(f"Embedding provider returned {len(vectors)} vectors for {len(batch)} texts")
+                return vectors
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.error(f"Embedding batch of {len(batch)} failed after {attempt} attempts: {e}")
+                    raise
+                delay = min(self.max_backoff_s, self.backoff_s * 2 ** (attempt - 1))
+                delay *= 0.5 + random.random() / 2
+                logger.warning(f"Embedding batch of {len(batch)} failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
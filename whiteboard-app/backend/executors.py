@@ -0,0 +1,113 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from config import (
+    EXECUTOR_DB_WORKERS,
+    EXECUTOR_EMBED_WORKERS,
+    EXECUTOR_VECTOR_WORKERS,
+    EXECUTOR_INGEST_WORKERS,
+)
+
+T = TypeVar("T")
+
+
+class BoundedExecutor:
+    """
+    Named thread pool for one kind of blocking call, so a backlog of slow
+    embedding calls cannot use up the threads database queries need. Tracks
+    how many calls are running and queued and how long they waited.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-call")
+        self._lock = threading.Lock()
+
+        self.active = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_s_total = 0.0
+        self.run_s_total = 0.0
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run fn(*args, **kwargs) on this pool and await its result."""
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+
+        def _call():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                self.wait_s_total += started - submitted
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1 if ok else 0
+                    self.failed += 0 if ok else 1
+                    self.run_s_total += time.perf_counter() - started
+
+        # Like asyncio.to_thread, carry context variables into the worker
+        context = contextvars.copy_context()
+        future = self._executor.submit(functools.partial(context.run, _call))
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # cancel() succeeds only if _call never started, so it never left the queue
+            if future.cancel():
+                with self._lock:
+                    self.queued -= 1
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            done = (self.completed + self.failed) or 1
+            return {
+                "max_workers": self.max_workers,
+                "active": self.active,
+                "queued": self.queued,
+                "peak_queued": self.peak_queued,
+                "utilization": round(self.active / self.max_workers, 3),
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(self.wait_s_total / done * 1000, 2),
+                "avg_run_ms": round(self.run_s_total / done * 1000, 2),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# One pool per blocking SDK; sized independently so each saturates on its own.
+# Groq and Qdrant queries use their native async clients and need no pool.
+db_executor = BoundedExecutor("db", EXECUTOR_DB_WORKERS)
+embed_executor = BoundedExecutor("embed", EXECUTOR_EMBED_WORKERS)
+vector_executor = BoundedExecutor("vector", EXECUTOR_VECTOR_WORKERS)
+# Long-running ingest windows get their own pool so they never queue ahead of query-time embeds
+ingest_step_executor = BoundedExecutor("ingest", EXECUTOR_INGEST_WORKERS)
+
+EXECUTORS = [db_executor, embed_executor, vector_executor, ingest_step_executor]
+
+
+def executor_stats() -> dict:
+    return {executor.name: executor.stats() for executor in EXECUTORS}
+
+
+def shutdown_executors():
+    for executor in EXECUTORS:
+        executor.shutdown()
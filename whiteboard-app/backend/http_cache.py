@@ -0,0 +1,189 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+_ENCODING_SUFFIXES = ("-gzip", "-zstd")
+
+
+def make_etag(resource_id: str, version: str, encoding: Optional[str] = None) -> str:
+    """
+    Strong ETag derived from a resource id and its last-modified marker. Each
+    content encoding is a different representation, so it gets its own tag.
+    """
+    tag = hashlib.sha256(f"{resource_id}:{version}".encode("utf-8")).hexdigest()[:32]
+    if encoding:
+        tag += f"-{encoding}"
+    return f'"{tag}"'
+
+
+def _opaque_tag(etag: str) -> str:
+    """The version part of an ETag, without the W/ prefix or encoding suffix."""
+    tag = etag.strip().removeprefix("W/").strip('"')
+    for suffix in _ENCODING_SUFFIXES:
+        if tag.endswith(suffix):
+            return tag[: -len(suffix)]
+    return tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison: the identity, gzip and zstd bodies of
+    # one version are equivalent, so a tag for any of them revalidates the others
+    target = _opaque_tag(etag)
+    return any(_opaque_tag(tag) == target for tag in if_none_match.split(","))
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick zstd (when available) or gzip from an Accept-Encoding header."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ("zstd", "gzip"):
+        if encoding == "zstd" and zstandard is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    raise ValueError(f"Unsupported encoding '{encoding}'")
+
+
+class SerializedBodyCache:
+    """
+    LRU of serialized (and lazily compressed) response bodies, keyed by
+    resource id and tagged with the ETag they were built for. Bounded by the
+    total size of the stored bytes. The lock only guards the index; bodies are
+    serialized and compressed outside it.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, min_compress_bytes: int = 1024):
+        self.max_bytes = max_bytes
+        self.min_compress_bytes = min_compress_bytes
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _size(entry: dict) -> int:
+        return sum(len(body) for body in entry["bodies"].values())
+
+    def _wants_compression(self, identity: bytes, encoding: Optional[str]) -> bool:
+        return encoding is not None and len(identity) >= self.min_compress_bytes
+
+    def get_ready(self, resource_id: str, etag: str, encoding: Optional[str]) -> Optional[tuple[bytes, Optional[str]]]:
+        """
+        Return (body, content_encoding) only if it is already built; never
+        serializes or compresses, so it is safe to call on the event loop.
+        """
+        with self._lock:
+            entry = self._entries.get(resource_id)
+            if entry is None or entry["etag"] != etag:
+                return None
+            identity = entry["bodies"][None]
+            if not self._wants_compression(identity, encoding):
+                result = identity, None
+            elif encoding in entry["bodies"]:
+                result = entry["bodies"][encoding], encoding
+            else:
+                return None
+            self._entries.move_to_end(resource_id)
+            self.hits += 1
+            return result
+
+    def get(self, resource_id: str, etag: str, encoding: Optional[str]) -> Optional[tuple[bytes, Optional[str]]]:
+        """
+        Return (body, content_encoding) for a cached ETag, compressing on first
+        request for an encoding. Compression can take tens of milliseconds for
+        large bodies, so call this from a worker thread.
+        """
+        with self._lock:
+            entry = self._entries.get(resource_id)
+            if entry is None or entry["etag"] != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(resource_id)
+            self.hits += 1
+            identity = entry["bodies"][None]
+            if not self._wants_compression(identity, encoding):
+                return identity, None
+            body = entry["bodies"].get(encoding)
+            if body is not None:
+                return body, encoding
+        # Compress without holding the lock; other requests keep being served meanwhile
+        body = compress(identity, encoding)
+        self._store_encoded(resource_id, etag, encoding, body)
+        return body, encoding
+
+    def put(self, resource_id: str, etag: str, payload: dict, encoding: Optional[str]) -> tuple[bytes, Optional[str]]:
+        """
+        Serialize payload once, cache it under etag, and return the body for
+        `encoding`. Serializes and compresses outside the lock; call this from
+        a worker thread.
+        """
+        identity = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        bodies = {None: identity}
+        result = identity, None
+        if self._wants_compression(identity, encoding):
+            bodies[encoding] = compress(identity, encoding)
+            result = bodies[encoding], encoding
+        with self._lock:
+            old = self._entries.pop(resource_id, None)
+            if old is not None:
+                self._bytes -= self._size(old)
+            entry = {"etag": etag, "bodies": bodies}
+            self._entries[resource_id] = entry
+            self._bytes += self._size(entry)
+            self._evict()
+        return result
+
+    def invalidate(self, resource_id: str):
+        with self._lock:
+            old = self._entries.pop(resource_id, None)
+            if old is not None:
+                self._bytes -= self._size(old)
+
+    def _store_encoded(self, resource_id: str, etag: str, encoding: str, body: bytes):
+        with self._lock:
+            entry = self._entries.get(resource_id)
+            # The entry may have been replaced or invalidated while compressing
+            if entry is None or entry["etag"] != etag or encoding in entry["bodies"]:
+                return
+            entry["bodies"][encoding] = body
+            self._bytes += len(body)
+            self._evict()
+
+    def _evict(self):
+        # Keep the most recent entry even if it alone exceeds the budget
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= self._size(evicted)
@@ -0,0 +1,248 @@
+import hashlib
+import logging
+import uuid
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+from config import EMBED_BATCH_SIZE, INGEST_MANIFEST_PATH
+from custom_types import RAGIngestCursor
+from data_loader import count_pdf_pages, embed_text_batches
+from ingest_executor import ingest_executor
+from ingest_manifest import ChunkOccurrences, IngestManifest
+from telemetry import CHUNKS, span
+from vector_db import QdrantStorage, get_storage, tenant_collection
+
+logger = logging.getLogger(__name__)
+
+# Remembers which version of each document finished ingesting, so unchanged re-uploads are skipped
+ingest_manifest = IngestManifest(INGEST_MANIFEST_PATH) if INGEST_MANIFEST_PATH else None
+# Chunk hash counts of documents mid-ingest; kept in the manifest file so every worker sees them
+chunk_occurrences = ChunkOccurrences(INGEST_MANIFEST_PATH or ":memory:")
+
+
+def point_id(source_id: str, chunk_hash: str, user_id: Optional[str] = None, occurrence: int = 0) -> str:
+    # Content-addressed: an unchanged chunk keeps its id across versions of the document.
+    # The n-th repeat of the same text within a document gets its own id.
+    name = f"{user_id}:{source_id}:{chunk_hash}" if user_id else f"{source_id}:{chunk_hash}"
+    if occurrence:
+        name += f":{occurrence}"
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, name))
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def point_ids(
+    source_id: str,
+    texts: Iterable[str],
+    user_id: Optional[str] = None,
+    hash_counts: Optional[dict[str, int]] = None,
+) -> list[str]:
+    """Point ids for consecutive chunks of one document; `hash_counts` is updated in place."""
+    hash_counts = {} if hash_counts is None else hash_counts
+    ids = []
+    for text in texts:
+        digest = chunk_hash(text)
+        # Keyed by a hash prefix to keep the streaming cursor small; a prefix clash only shifts numbering
+        occurrence = hash_counts.get(digest[:16], 0)
+        hash_counts[digest[:16]] = occurrence + 1
+        ids.append(point_id(source_id, digest, user_id, occurrence))
+    return ids
+
+
+def file_sha256(path: str, block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_payload(
+    source_id: str,
+    chunk_index: int,
+    text: str,
+    user_id: Optional[str] = None,
+    file_hash: Optional[str] = None,
+) -> dict:
+    # The chunk index lets the context packer stitch neighbouring hits back together
+    payload = {"source": source_id, "chunk": chunk_index, "text": text}
+    if user_id:
+        payload["user_id"] = user_id
+    if file_hash:
+        payload["file_hash"] = file_hash
+    return payload
+
+
+def is_unchanged(source_id: str, file_hash: str, user_id: Optional[str] = None) -> bool:
+    """True if this exact file was already fully ingested and its points are still stored."""
+    if ingest_manifest is None:
+        return False
+    store = get_storage(tenant_collection(user_id))
+    if ingest_manifest.get(store.collection, source_id, user_id) != file_hash:
+        return False
+    return store.has_document_version(source_id, file_hash, user_id)
+
+
+def start_cursor(
+    pdf_path: str,
+    source_id: str,
+    user_id: Optional[str] = None,
+    file_hash: Optional[str] = None,
+) -> RAGIngestCursor:
+    file_hash = file_hash or file_sha256(pdf_path)
+    if is_unchanged(source_id, file_hash, user_id):
+        logger.info(f"Skipping '{source_id}': file hash unchanged since the last ingest")
+        return RAGIngestCursor(source_id=source_id, total_pages=0, user_id=user_id, file_hash=file_hash, skipped=True)
+    # Counts from an earlier, possibly different, window split must not leak into this run
+    chunk_occurrences.clear(tenant_collection(user_id), source_id, user_id)
+    return RAGIngestCursor(
+        source_id=source_id, total_pages=count_pdf_pages(pdf_path), user_id=user_id, file_hash=file_hash
+    )
+
+
+def finish_ingest(source_id: str, file_hash: str, chunks: int, user_id: Optional[str] = None) -> None:
+    """Drop points left over from earlier versions of the document, then mark this version as complete."""
+    store = get_storage(tenant_collection(user_id))
+    store.delete_stale(source_id, file_hash, user_id)
+    if ingest_manifest is not None:
+        ingest_manifest.record(store.collection, source_id, file_hash, chunks, user_id)
+    chunk_occurrences.clear(store.collection, source_id, user_id)
+
+
+def _batched(chunks: Iterable[str], size: int) -> Iterator[list[str]]:
+    batch: list[str] = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def upsert_chunk_stream(
+    source_id: str,
+    chunks: Iterable[str],
+    chunk_offset: int = 0,
+    store: Optional[QdrantStorage] = None,
+    user_id: Optional[str] = None,
+    file_hash: Optional[str] = None,
+    hash_counts: Optional[dict[str, int]] = None,
+) -> tuple[int, int]:
+    """
+    Embed and upsert a stream of chunks batch by batch, returning how many
+    chunks were seen and how many of them were already stored.
+
+    Point ids are derived from chunk content, so chunks kept from an earlier
+    version of the document are not embedded again; only their chunk index
+    and file hash are refreshed. Repeated texts are numbered by occurrence
+    so each keeps its own point; `hash_counts`, updated in place, seeds the
+    numbering with counts from earlier page windows. Only a few embedding
+    batches are held in memory at a time, and each batch is upserted as
+    soon as its vectors arrive, so early chunks become searchable while
+    later ones are still being produced.
+    """
+    store = store or get_storage(tenant_collection(user_id))
+
+    # New points waiting for their vectors, in the order their texts were sent
+    pending: list[list[tuple[str, dict]]] = []
+    counts = {"seen": 0, "reused": 0}
+    hash_counts = {} if hash_counts is None else hash_counts
+
+    def _new_batches() -> Iterator[list[str]]:
+        offset = chunk_offset
+        for batch in _batched(chunks, EMBED_BATCH_SIZE):
+            points = [
+                (pid, chunk_payload(source_id, offset + i, text, user_id, file_hash))
+                for i, (pid, text) in enumerate(zip(point_ids(source_id, batch, user_id, hash_counts), batch))
+            ]
+            offset += len(batch)
+            counts["seen"] += len(batch)
+
+            existing = store.existing_ids([pid for pid, _ in points])
+            reused = [(pid, payload) for pid, payload in points if pid in existing]
+            if reused:
+                refreshed = [{k: payload[k] for k in ("chunk", "file_hash") if k in payload} for _, payload in reused]
+                store.update_payloads([pid for pid, _ in reused], refreshed)
+                counts["reused"] += len(reused)
+                CHUNKS.labels(result="reused").inc(len(reused))
+
+            new = [(pid, payload) for pid, payload in points if pid not in existing]
+            if new:
+                pending.append(new)
+                yield [payload["text"] for _, payload in new]
+
+    for vectors in embed_text_batches(_new_batches()):
+        batch = pending.pop(0)
+        with span("upsert"):
+            store.upsert([pid for pid, _ in batch], vectors, [payload for _, payload in batch])
+        CHUNKS.labels(result="embedded").inc(len(batch))
+    return counts["seen"], counts["reused"]
+
+
+def ingest_page_window(pdf_path: str, cursor: RAGIngestCursor, pages: int) -> RAGIngestCursor:
+    """Stream one window of pages through chunk -> embed -> upsert and return the advanced cursor."""
+    end_page = min(cursor.next_page + pages, cursor.total_pages)
+    chunks = ingest_executor.iter_page_chunks(pdf_path, cursor.next_page, end_page)
+    # Repeats of texts from earlier windows are numbered on from those windows' counts
+    collection = tenant_collection(cursor.user_id)
+    earlier = chunk_occurrences.before(collection, cursor.source_id, cursor.file_hash, cursor.next_page, cursor.user_id)
+    hash_counts = dict(earlier)
+    count, reused = upsert_chunk_stream(
+        cursor.source_id, chunks, cursor.chunk_offset,
+        user_id=cursor.user_id, file_hash=cursor.file_hash, hash_counts=hash_counts,
+    )
+    window_counts = {h: n - earlier.get(h, 0) for h, n in hash_counts.items() if n != earlier.get(h, 0)}
+    chunk_occurrences.record(
+        collection, cursor.source_id, cursor.file_hash, cursor.next_page, window_counts, cursor.user_id
+    )
+
+    logger.info(
+        f"Ingested pages {cursor.next_page}-{end_page} of '{cursor.source_id}' ({count} chunks, {reused} unchanged)"
+    )
+    return cursor.model_copy(update={
+        "next_page": end_page,
+        "chunk_offset": cursor.chunk_offset + count,
+        "ingested": cursor.ingested + count,
+        "reused": cursor.reused + reused,
+    })
+
+
+def bulk_ingest(paths: Union[str, Iterable[str]], user_id: Optional[str] = None) -> dict[str, int]:
+    """
+    Ingest a directory or list of PDFs, owned by user_id when given. Documents
+    are parsed and chunked across the process pool while earlier ones are
+    embedded and upserted; unchanged files are skipped.
+    """
+    if isinstance(paths, (str, Path)):
+        root = Path(paths)
+        paths = sorted(str(p) for p in root.rglob("*.pdf")) if root.is_dir() else [str(root)]
+
+    paths = list(paths)
+    hashes = {path: file_sha256(path) for path in paths}
+    changed = [path for path in paths if not is_unchanged(Path(path).name, hashes[path], user_id)]
+
+    store = get_storage(tenant_collection(user_id))
+    ingested: dict[str, int] = {}
+    for path, chunks in ingest_executor.iter_documents(changed):
+        source_id = Path(path).name
+        count, reused = upsert_chunk_stream(source_id, chunks, store=store, user_id=user_id, file_hash=hashes[path])
+        finish_ingest(source_id, hashes[path], count, user_id)
+        ingested[source_id] = count - reused
+        logger.info(f"Bulk ingested '{source_id}' ({count} chunks, {reused} unchanged)")
+    return ingested
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Bulk ingest PDFs into the vector store")
+    parser.add_argument("paths", nargs="+", help="PDF files or directories")
+    parser.add_argument("--user-id", help="Owner of the documents; only this user's queries will find them")
+    args = parser.parse_args()
+    targets = args.paths if len(args.paths) > 1 else args.paths[0]
+    results = bulk_ingest(targets, user_id=args.user_id)
+    print(f"Embedded {sum(results.values())} new chunks from {len(results)} changed documents")
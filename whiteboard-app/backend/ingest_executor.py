@@ -0,0 +1,105 @@
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional
+
+from config import INGEST_WORKERS, INGEST_PAGES_PER_TASK
+from data_loader import iter_pdf_pages, splitter
+from telemetry import observe
+
+logger = logging.getLogger(__name__)
+
+
+def _chunk_pages(path: str, start_page: int, end_page: Optional[int]) -> tuple[list[str], float, float]:
+    # Runs in a worker process, so it must stay a picklable module-level function.
+    # Metrics recorded here would land in the worker's registry, so parse and
+    # chunk times are returned for the parent to record.
+    chunks: list[str] = []
+    parse_s = chunk_s = 0.0
+    pages = iter_pdf_pages(path, start_page, end_page)
+    while True:
+        mark = time.perf_counter()
+        page = next(pages, None)
+        parse_s += time.perf_counter() - mark
+        if page is None:
+            break
+        mark = time.perf_counter()
+        chunks.extend(splitter.split_text(page[1]))
+        chunk_s += time.perf_counter() - mark
+    return chunks, parse_s, chunk_s
+
+
+def _observed(result: tuple[list[str], float, float]) -> list[str]:
+    chunks, parse_s, chunk_s = result
+    observe("parse", parse_s)
+    observe("chunk", chunk_s)
+    return chunks
+
+
+class IngestExecutor:
+    """
+    Process pool for the CPU-bound half of ingest: PDF text extraction and
+    sentence splitting.
+
+    Work is fanned out in page ranges (for one large document) or whole
+    documents (for bulk loads). Results are yielded in submission order with a
+    bounded look-ahead, so the embed/upsert stage can consume them as a stream.
+    """
+
+    def __init__(self, max_workers: int = INGEST_WORKERS, pages_per_task: int = INGEST_PAGES_PER_TASK):
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        # Started on first use so importing this module never starts processes
+        if self._pool is None:
+            logger.info(f"Starting ingest process pool with {self.max_workers} workers")
+            # Forking the multithreaded server could copy locks held by other threads into the
+            # workers; a forkserver forks from a clean single-threaded process that has already
+            # imported the parser, so workers start fast and lock-free
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["data_loader"])
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+        return self._pool
+
+    def iter_page_chunks(self, path: str, start_page: int, end_page: int) -> Iterator[str]:
+        """Chunk a page range of one PDF in parallel, yielding chunks in page order."""
+        ranges = (
+            (page, min(page + self.pages_per_task, end_page))
+            for page in range(start_page, end_page, self.pages_per_task)
+        )
+        for result in self._ordered(_chunk_pages, ((path, start, end) for start, end in ranges)):
+            yield from _observed(result)
+
+    def iter_documents(self, paths: Iterable[str]) -> Iterator[tuple[str, list[str]]]:
+        """Chunk many PDFs in parallel, yielding (path, chunks) in input order."""
+        paths = list(paths)
+        for path, result in zip(paths, self._ordered(_chunk_pages, ((p, 0, None) for p in paths))):
+            yield path, _observed(result)
+
+    def _ordered(self, fn, arg_tuples: Iterable[tuple]) -> Iterator:
+        # Keep at most two tasks per worker outstanding to bound parsed-but-unconsumed text
+        window = self.max_workers * 2
+        pending: deque = deque()
+        try:
+            for args in arg_tuples:
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+                pending.append(self.pool.submit(fn, *args))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+ingest_executor = IngestExecutor()
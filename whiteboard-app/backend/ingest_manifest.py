@@ -0,0 +1,119 @@
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class IngestManifest:
+    """
+    Hash of the last fully ingested version of each document, keyed by
+    collection, owner and source id. Entries are written only after stale
+    points were removed, so an interrupted ingest is never mistaken for a
+    finished one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("pragma journal_mode=wal")
+        self._db.execute(
+            "create table if not exists documents ("
+            "collection text not null, user_id text not null, source text not null, "
+            "file_hash text not null, chunks integer not null, updated_at real not null, "
+            "primary key (collection, user_id, source))"
+        )
+        self._db.commit()
+        logger.info(f"Ingest manifest persisted at '{path}'")
+
+    def get(self, collection: str, source_id: str, user_id: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "select file_hash from documents where collection = ? and user_id = ? and source = ?",
+                (collection, user_id or "", source_id),
+            ).fetchone()
+        return row[0] if row else None
+
+    def record(self, collection: str, source_id: str, file_hash: str, chunks: int, user_id: Optional[str] = None):
+        with self._lock:
+            self._db.execute(
+                "insert or replace into documents (collection, user_id, source, file_hash, chunks, updated_at) "
+                "values (?, ?, ?, ?, ?, ?)",
+                (collection, user_id or "", source_id, file_hash, chunks, time.time()),
+            )
+            self._db.commit()
+
+
+class ChunkOccurrences:
+    """
+    How often each chunk hash occurred in each page window of a document
+    that is being ingested, so a later window can number repeats of texts
+    from earlier windows without every hash riding along in the Inngest step
+    payload. Counts are stored per window, so a retried window replaces its
+    own rows instead of counting twice.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("pragma journal_mode=wal")
+        self._db.execute(
+            "create table if not exists chunk_occurrences ("
+            "collection text not null, user_id text not null, source text not null, file_hash text not null, "
+            "start_page integer not null, hash text not null, count integer not null, "
+            "primary key (collection, user_id, source, file_hash, start_page, hash))"
+        )
+        self._db.commit()
+
+    def before(
+        self, collection: str, source_id: str, file_hash: str, start_page: int, user_id: Optional[str] = None
+    ) -> dict[str, int]:
+        """Occurrences of each hash in the windows that start before `start_page`."""
+        with self._lock:
+            rows = self._db.execute(
+                "select hash, sum(count) from chunk_occurrences "
+                "where collection = ? and user_id = ? and source = ? and file_hash = ? and start_page < ? "
+                "group by hash",
+                (collection, user_id or "", source_id, file_hash, start_page),
+            ).fetchall()
+        return dict(rows)
+
+    def record(
+        self,
+        collection: str,
+        source_id: str,
+        file_hash: str,
+        start_page: int,
+        counts: dict[str, int],
+        user_id: Optional[str] = None,
+    ):
+        key = (collection, user_id or "", source_id, file_hash, start_page)
+        with self._lock:
+            self._db.execute(
+                "delete from chunk_occurrences "
+                "where collection = ? and user_id = ? and source = ? and file_hash = ? and start_page = ?",
+                key,
+            )
+            self._db.executemany(
+                "insert into chunk_occurrences "
+                "(collection, user_id, source, file_hash, start_page, hash, count) values (?, ?, ?, ?, ?, ?, ?)",
+                [(*key, digest, count) for digest, count in counts.items()],
+            )
+            self._db.commit()
+
+    def clear(self, collection: str, source_id: str, user_id: Optional[str] = None):
+        """Forget the counts of every version of a document."""
+        with self._lock:
+            self._db.execute(
+                "delete from chunk_occurrences where collection = ? and user_id = ? and source = ?",
+                (collection, user_id or "", source_id),
+            )
+            self._db.commit()
@@ -1,44 +1,197 @@
+import asyncio
+import base64
+import hashlib
+import json
 import logging
 import os
 import datetime
+import time
 import uuid
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, Depends, Header, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional
-from supabase import create_client, Client
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Iterator, Optional
+from supabase import Client
+from postgrest.types import CountMethod, ReturnMethod
 from dotenv import load_dotenv
-from groq import Groq
 import inngest
 import inngest.fast_api
-import requests
-
-from config import SUPABASE_URL, SUPABASE_ANON_KEY, CORS_ORIGINS
-from data_loader import load_and_chunk_pdf, embed_texts
-from vector_db import QdrantStorage
-from custom_types import RAGSearchResult, RAGUpsertResult, RAGChunkAndSrc
+import httpx
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from config import (
+    SUPABASE_URL,
+    SUPABASE_ANON_KEY,
+    SUPABASE_JWT_SECRET,
+    AUTH_CACHE_TTL_S,
+    AUTH_CACHE_MAX_ENTRIES,
+    SUPABASE_CLIENT_POOL_SIZE,
+    CORS_ORIGINS,
+    INGEST_MODE,
+    INGEST_PAGES_PER_STEP,
+    RESULT_BROKER_URL,
+    RESULT_TTL_S,
+    RAG_QUERY_TIMEOUT_S,
+    RAG_QUERY_MODE,
+    WHITEBOARD_BODY_CACHE_MAX_BYTES,
+    COMPRESSION_MIN_BYTES,
+    WRITE_BUFFER_ENABLED,
+    WRITE_BUFFER_FLUSH_INTERVAL_S,
+    WRITE_BUFFER_MAX_MERGED_SAVES,
+    UPLOAD_DIR,
+    UPLOAD_MAX_BYTES,
+    UPLOAD_CHUNK_BYTES,
+    UPLOAD_FORM_OVERHEAD_BYTES,
+    RAG_BATCH_MAX_QUESTIONS,
+)
+from data_loader import load_and_chunk_pdf, embedding_cache
+from vector_db import corpus_version
+from rag_pipeline import (
+    answer_cache,
+    answer_scope,
+    embed_question,
+    search_contexts,
+    build_user_content,
+    llm_answer_async,
+    llm_stream,
+    run_query,
+    embed_questions,
+    run_query_batch,
+)
+from result_broker import create_result_broker
+from whiteboard_delta import StaleElementsError
+from write_buffer import WhiteboardWriteBuffer, WriteBufferFlushError
+from http_cache import SerializedBodyCache, make_etag, etag_matches, negotiate_encoding
+from auth import AuthUser, Authenticator, SupabaseClientPool, VerifiedTokenCache
+from ingest import start_cursor, ingest_page_window, upsert_chunk_stream, finish_ingest
+from ingest_executor import ingest_executor
+from executors import (
+    db_executor,
+    vector_executor,
+    ingest_step_executor,
+    executor_stats,
+    shutdown_executors,
+)
+from custom_types import RAGSearchResult, RAGUpsertResult, RAGChunkAndSrc, RAGIngestCursor
+from telemetry import (
+    TRACE_HEADER,
+    bind_trace_id,
+    current_trace_id,
+    observe,
+    register_stats_collector,
+    span,
+    valid_trace_id,
+)
 
 load_dotenv()
 
-# Groq client reads GROQ_API_KEY from environment
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+logger = logging.getLogger("uvicorn")
 
 # Inngest client setup
 inngest_client = inngest.Inngest(
     app_id="whiteboard-rag",
-    logger=logging.getLogger("uvicorn"),
+    logger=logger,
     is_production=False,
     serializer=inngest.PydanticSerializer(),
 )
 
-# Global results cache for local development/sync-over-async
-run_results = {}
+# Supabase clients are reused across requests; tokens are verified locally when a JWT secret is set
+supabase_pool = SupabaseClientPool(SUPABASE_URL, SUPABASE_ANON_KEY, max_idle=SUPABASE_CLIENT_POOL_SIZE)
+authenticator = Authenticator(
+    supabase_pool,
+    jwt_secret=SUPABASE_JWT_SECRET,
+    cache=VerifiedTokenCache(max_entries=AUTH_CACHE_MAX_ENTRIES, ttl_s=AUTH_CACHE_TTL_S),
+)
+
+# Serialized/compressed whiteboard bodies, reused while updated_at is unchanged
+whiteboard_body_cache = SerializedBodyCache(
+    max_bytes=WHITEBOARD_BODY_CACHE_MAX_BYTES,
+    min_compress_bytes=COMPRESSION_MIN_BYTES,
+)
+
+async def _write_whiteboard(whiteboard_id: str, user_id: str, token: str, update_data: dict) -> int:
+    def _write() -> int:
+        with supabase_pool.client(token) as supabase:
+            response = supabase.table("whiteboards") \
+                .update(update_data, count=CountMethod.exact, returning=ReturnMethod.minimal) \
+                .eq("id", whiteboard_id) \
+                .eq("user_id", user_id) \
+                .execute()
+            return response.count or 0
+    return await db_executor.run(_write)
+
+
+# Coalesces rapid autosaves into one database write per board per interval
+write_buffer = (
+    WhiteboardWriteBuffer(
+        _write_whiteboard,
+        flush_interval_s=WRITE_BUFFER_FLUSH_INTERVAL_S,
+        max_merged_saves=WRITE_BUFFER_MAX_MERGED_SAVES,
+    )
+    if WRITE_BUFFER_ENABLED
+    else None
+)
+
+# Keep-alive client for the Inngest REST API
+inngest_api = httpx.AsyncClient(timeout=10.0)
+
+# Function results handed to waiting request handlers; TTL-bounded
+result_broker = create_result_broker(RESULT_BROKER_URL, ttl_s=RESULT_TTL_S)
 
 app = FastAPI(title="Whiteboard API", version="1.0.0")
 
+
+def _cache_stats() -> dict[str, dict]:
+    caches = {"answer": answer_cache, "embedding": embedding_cache}
+    return {name: cache.stats() for name, cache in caches.items() if cache is not None}
+
+
+# Cache and executor counters are read at scrape time
+register_stats_collector(_cache_stats, executor_stats)
+
+
+@app.on_event("startup")
+async def start_write_buffer():
+    if write_buffer is not None:
+        write_buffer.start()
+
+
+@app.on_event("shutdown")
+async def flush_write_buffer():
+    if write_buffer is not None:
+        await write_buffer.stop()
+
+
+@app.on_event("shutdown")
+async def shutdown_executors_and_clients():
+    ingest_executor.shutdown()
+    shutdown_executors()
+    await inngest_api.aclose()
+
+
+# Registered before CORS so CORS stays outermost and browsers can read the 413
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Reject oversized uploads from Content-Length before the multipart body is spooled
+    if request.url.path == "/api/rag/upload":
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD_BYTES:
+            return JSONResponse(status_code=413, content={"detail": f"File exceeds {UPLOAD_MAX_BYTES} bytes"})
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Reuse a well-formed caller trace id; it is forwarded to Inngest in event data
+    trace_id = bind_trace_id(valid_trace_id(request.headers.get(TRACE_HEADER)))
+    response = await call_next(request)
+    response.headers[TRACE_HEADER] = trace_id
+    return response
+
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -55,35 +208,66 @@ app.add_middleware(
     fn_id="RAG: Ingest PDF",
     trigger=inngest.TriggerEvent(event="rag/ingest_pdf"),
     throttle=inngest.Throttle(limit=2, period=datetime.timedelta(minutes=1)),
-    rate_limit=inngest.RateLimit(
-        limit=1,
-        period=datetime.timedelta(hours=4),
-        key="event.data.source_id",
-    ),
+    # Re-uploads of one document run one after another instead of being dropped;
+    # unchanged files are skipped by hash and changed ones only embed new chunks
+    concurrency=[
+        inngest.Concurrency(limit=1, key='event.data.user_id + "/" + event.data.source_id'),
+    ],
 )
 async def rag_ingest_pdf(ctx: inngest.Context):
+    bind_trace_id(valid_trace_id(ctx.event.data.get("trace_id")) or ctx.event.id)
+    user_id = ctx.event.data.get("user_id")
+    pdf_path = ctx.event.data["pdf_path"]
+    source_id = ctx.event.data.get("source_id", pdf_path)
+
     def _load(ctx: inngest.Context) -> RAGChunkAndSrc:
-        pdf_path = ctx.event.data["pdf_path"]
-        source_id = ctx.event.data.get("source_id", pdf_path)
         chunks = load_and_chunk_pdf(pdf_path)
         return RAGChunkAndSrc(chunks=chunks, source_id=source_id)
 
-    def _upsert(chunks_and_src: RAGChunkAndSrc) -> RAGUpsertResult:
-        chunks = chunks_and_src.chunks
-        source_id = chunks_and_src.source_id
-
-        vecs = embed_texts(chunks)
-        ids = [str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source_id}:{i}")) for i in range(len(chunks))]
-        payloads = [{"source": source_id, "text": chunks[i]} for i in range(len(chunks))]
-
-        QdrantStorage().upsert(ids, vecs, payloads)
-        return RAGUpsertResult(ingested=len(chunks))
-
-    chunks_and_src = await ctx.step.run("load-and-chunk", lambda: _load(ctx), output_type=RAGChunkAndSrc)
-    ingested = await ctx.step.run("embed-and-upsert", lambda: _upsert(chunks_and_src), output_type=RAGUpsertResult)
+    def _upsert(chunks_and_src: RAGChunkAndSrc, file_hash: str) -> RAGUpsertResult:
+        count, reused = upsert_chunk_stream(
+            chunks_and_src.source_id, chunks_and_src.chunks, user_id=user_id, file_hash=file_hash
+        )
+        logger.info(
+            f"Upserted {count - reused} new chunks of '{source_id}' ({reused} unchanged)"
+        )
+        return RAGUpsertResult(ingested=count, reused=reused)
+
+    cursor = await ctx.step.run(
+        "open-pdf",
+        lambda: ingest_step_executor.run(start_cursor, pdf_path, source_id, user_id, ctx.event.data.get("file_hash")),
+        output_type=RAGIngestCursor,
+    )
+    if cursor.skipped:
+        ingested = RAGUpsertResult(ingested=0, skipped=True)
+    elif INGEST_MODE == "streaming":
+        # Steps carry only a page/chunk cursor; chunk text never crosses the step boundary
+        while cursor.next_page < cursor.total_pages:
+            cursor = await ctx.step.run(
+                f"ingest-pages-{cursor.next_page}",
+                # Parsing fans out to the process pool; the thread just waits on it and on embedding
+                lambda c=cursor: ingest_step_executor.run(ingest_page_window, pdf_path, c, INGEST_PAGES_PER_STEP),
+                output_type=RAGIngestCursor,
+            )
+        ingested = RAGUpsertResult(ingested=cursor.ingested, reused=cursor.reused)
+    else:
+        chunks_and_src = await ctx.step.run(
+            "load-and-chunk", lambda: ingest_step_executor.run(_load, ctx), output_type=RAGChunkAndSrc
+        )
+        ingested = await ctx.step.run(
+            "embed-and-upsert",
+            lambda: ingest_step_executor.run(_upsert, chunks_and_src, cursor.file_hash),
+            output_type=RAGUpsertResult,
+        )
+    if not cursor.skipped:
+        # Runs last so a failed ingest never deletes the previous version's points
+        await ctx.step.run(
+            "remove-stale-chunks",
+            lambda: vector_executor.run(finish_ingest, source_id, cursor.file_hash, ingested.ingested, user_id),
+        )
     result = ingested.model_dump()
-    # Store in local cache for synchronous polling
-    run_results[ctx.event.id] = result
+    # Wake any request waiting on this event
+    await result_broker.publish(ctx.event.id, result)
     return result
 
 
@@ -92,76 +276,29 @@ async def rag_ingest_pdf(ctx: inngest.Context):
     trigger=inngest.TriggerEvent(event="rag/query_pdf_ai"),
 )
 async def rag_query_pdf_ai(ctx: inngest.Context):
-    print(f"DEBUG: rag_query_pdf_ai STARTED. event_id={ctx.event.id}")
+    trace_id = bind_trace_id(valid_trace_id(ctx.event.data.get("trace_id")) or ctx.event.id)
+    logger.debug(f"rag_query_pdf_ai started event_id={ctx.event.id} trace_id={trace_id}")
     try:
-        def _search(question: str, top_k: int = 3) -> RAGSearchResult:
-            try:
-                query_vec = embed_texts([question])[0]
-                store = QdrantStorage()
-                found = store.search(query_vec, top_k)
-                return RAGSearchResult(contexts=found["contexts"], sources=found["sources"])
-            except Exception as e:
-                # If collection doesn't exist or search fails, return empty results
-                print(f"Search failed: {e}")
-                return RAGSearchResult(contexts=[], sources=[])
-
-        def _llm_answer(user_content: str) -> str:
-            response = groq_client.chat.completions.create(
-                model=GROQ_MODEL,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful assistant. Answer questions using the provided context when relevant. If the answer IS found in the context, cite it. If the answer is NOT in the context, you may still answer using your general knowledge but clearly warn the user with: '⚠️ Note: This answer is from my general knowledge, not from your uploaded documents.'"
-                    },
-                    {
-                        "role": "user",
-                        "content": user_content
-                    }
-                ],
-                temperature=0.2,
-                max_tokens=1024,
-            )
-            text = response.choices[0].message.content
-            if not text:
-                raise RuntimeError("Groq returned no text.")
-            return text.strip()
-
         question = ctx.event.data["question"]
         top_k = int(ctx.event.data.get("top_k", 3))
+        user_id = ctx.event.data.get("user_id")
 
-        found = await ctx.step.run("embed-and-search", lambda: _search(question, top_k), output_type=RAGSearchResult)
+        found = await ctx.step.run(
+            "embed-and-search", lambda: search_contexts(question, top_k, user_id=user_id), output_type=RAGSearchResult
+        )
 
-        # Handle case where no PDFs are uploaded or no relevant contexts found
         contexts = found.contexts
         sources = found.sources
+        user_content = build_user_content(question, contexts)
 
-        if not contexts or len(contexts) == 0:
-            print(f"No relevant contexts found for question: {question}")
-            user_content = (
-                f"Question: {question}\n\n"
-                "Note: No PDF documents have been uploaded yet, or the question is not related to any uploaded documents. "
-                "Please answer the question using your general knowledge, and clearly state that this information is not from uploaded documents."
-            )
-        else:
-            print(f"Found {len(contexts)} contexts for question: {question}")
-            context_block = "\n\n".join(f"- {c}" for c in contexts)
-            user_content = (
-                "Use the following context to answer the question.\n\n"
-                f"Context:\n{context_block}\n\n"
-                f"Question: {question}\n"
-                "Answer concisely using the context above. If the answer is not contained in the context, answer the question, but specify that it is not from the sources given."
-            )
-
-        answer = await ctx.step.run("llm-answer", lambda: _llm_answer(user_content))
+        answer = await ctx.step.run("llm-answer", lambda: llm_answer_async(user_content))
 
         result = {"answer": answer, "sources": sources, "num_contexts": len(contexts)}
-        # Store in local cache for synchronous polling
-        run_results[ctx.event.id] = result
+        # Wake any request waiting on this event; it stores the answer in its cache
+        await result_broker.publish(ctx.event.id, result)
         return result
-    except Exception as e:
-        print(f"ERROR in rag_query_pdf_ai: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception(f"rag_query_pdf_ai failed event_id={ctx.event.id} trace_id={trace_id}")
         raise
 
 
@@ -181,6 +318,18 @@ class WhiteboardUpdate(BaseModel):
     excalidraw_data: Optional[dict] = None
 
 
+class ElementRef(BaseModel):
+    id: str
+    version: int = 0
+
+
+class WhiteboardPatch(BaseModel):
+    upserts: list[dict] = []
+    deletes: list[ElementRef] = []
+    files: Optional[dict] = None
+    app_state: Optional[dict] = None
+
+
 class WhiteboardResponse(BaseModel):
     id: str
     user_id: str
@@ -195,31 +344,35 @@ class RAGQueryRequest(BaseModel):
     top_k: int = 5
 
 
+class RAGBatchQueryRequest(BaseModel):
+    questions: list[str] = Field(min_length=1, max_length=RAG_BATCH_MAX_QUESTIONS)
+    top_k: int = 5
+
+
 # ============ DEPENDENCIES ============
 
-async def get_supabase_client(authorization: str = Header(...)) -> tuple[Client, dict]:
-    """
-    Creates a Supabase client with the user's JWT token for RLS.
-    Returns the client and the authenticated user.
-    """
+def _bearer_token(authorization: str) -> str:
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid authorization header")
-    
-    token = authorization.replace("Bearer ", "")
-    
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+    return authorization.replace("Bearer ", "")
+
+
+def get_supabase_client(authorization: str = Header(...)) -> Iterator[tuple[Client, AuthUser]]:
+    """
+    Verifies the user's JWT and checks out a pooled Supabase client carrying
+    that token for RLS. Yields the client and the authenticated user.
+    """
+    token = _bearer_token(authorization)
     
     try:
-        user_response = supabase.auth.get_user(token)
-        if not user_response.user:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        supabase.postgrest.auth(token)
-        
-        return supabase, user_response.user
+        with span("auth"):
+            user = authenticator.verify(token)
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
 
+    with supabase_pool.client(token) as supabase:
+        yield supabase, user
+
 
 # ============ HELPER FUNCTIONS ============
 
@@ -227,37 +380,81 @@ def _inngest_api_base() -> str:
     return os.getenv("INNGEST_API_BASE", "http://127.0.0.1:8288/api/v1")
 
 
-def fetch_runs(event_id: str) -> list[dict]:
+async def fetch_runs(event_id: str) -> list[dict]:
     url = f"{_inngest_api_base()}/events/{event_id}/runs"
-    resp = requests.get(url)
+    resp = await inngest_api.get(url)
     resp.raise_for_status()
     data = resp.json()
     return data.get("data", [])
 
 
-async def wait_for_run_output(event_id: str, timeout_s: float = 60.0, poll_interval_s: float = 0.5) -> dict:
-    import asyncio
-    import time
-    start = time.time()
-    while True:
-        if event_id in run_results:
-            return run_results[event_id]
-        
-        # In local dev, we primarily trust our in-memory cache
-        # because the Dev Server API can be inconsistent or return HTML errors
-        
-        if time.time() - start > timeout_s:
-            raise TimeoutError(f"Timed out waiting for run output in local cache for event_id {event_id}")
-        await asyncio.sleep(poll_interval_s)
+# Columns needed to render the dashboard; excalidraw_data is fetched per board
+WHITEBOARD_LIST_COLUMNS = "id, user_id, title, created_at, updated_at"
+
+
+def encode_list_cursor(updated_at: str, whiteboard_id: str) -> str:
+    raw = json.dumps([updated_at, whiteboard_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
 
+def decode_list_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        updated_at, whiteboard_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        # Validate before interpolating into the PostgREST filter
+        datetime.datetime.fromisoformat(updated_at)
+        uuid.UUID(whiteboard_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    return updated_at, whiteboard_id
+
+
+def _round_timings(timings: dict) -> dict:
+    return {stage: round(ms, 1) for stage, ms in timings.items()}
+
+
+def _copy_hashed(src, dst: Path, max_bytes: int, chunk_bytes: int) -> tuple[str, int]:
+    """Copy src to dst in fixed-size chunks, hashing on the fly. Returns (sha256, size)."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(dst, "wb") as out:
+        while True:
+            block = src.read(chunk_bytes)
+            if not block:
+                break
+            if size == 0 and not block.startswith(b"%PDF"):
+                raise HTTPException(status_code=400, detail="File is not a PDF")
+            size += len(block)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File exceeds {max_bytes} bytes")
+            digest.update(block)
+            out.write(block)
+    if size == 0:
+        raise HTTPException(status_code=400, detail="File is empty")
+    return digest.hexdigest(), size
+
+
+async def save_uploaded_pdf(file: UploadFile) -> tuple[Path, str, int]:
+    """
+    Stream an upload to UPLOAD_DIR off the event loop and store it under its
+    content hash, so same-named uploads never collide and identical files are
+    stored once. Returns (path, sha256, size).
+    """
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds {UPLOAD_MAX_BYTES} bytes")
 
-def save_uploaded_pdf(file: UploadFile) -> Path:
-    uploads_dir = Path("uploads")
+    uploads_dir = Path(UPLOAD_DIR)
     uploads_dir.mkdir(parents=True, exist_ok=True)
-    file_path = uploads_dir / file.filename
-    file_bytes = file.file.read()
-    file_path.write_bytes(file_bytes)
-    return file_path
+    partial = uploads_dir / f".{uuid.uuid4().hex}.part"
+    try:
+        file_hash, size = await asyncio.to_thread(
+            _copy_hashed, file.file, partial, UPLOAD_MAX_BYTES, UPLOAD_CHUNK_BYTES
+        )
+        file_path = uploads_dir / f"{file_hash}.pdf"
+        # Atomic, and a no-op in effect when the same content was uploaded before
+        await asyncio.to_thread(os.replace, partial, file_path)
+        return file_path, file_hash, size
+    finally:
+        partial.unlink(missing_ok=True)
 
 
 # ============ ROOT ENDPOINTS ============
@@ -267,26 +464,65 @@ async def root():
     return {"message": "Whiteboard API", "version": "1.0.0"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms and chunk, token and cache counters."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    health = {"status": "healthy", "executors": executor_stats()}
+    if write_buffer is not None:
+        health["write_buffer"] = write_buffer.stats()
+    return health
 
 
 # ============ WHITEBOARD ENDPOINTS ============
 
 @app.get("/api/whiteboards")
-async def get_whiteboards(auth: tuple = Depends(get_supabase_client)):
-    """Get all whiteboards for the authenticated user."""
+async def get_whiteboards(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    auth: tuple = Depends(get_supabase_client)
+):
+    """
+    List the authenticated user's whiteboards, newest first. Only metadata
+    columns are returned; pass `next_cursor` back as `cursor` for the next page.
+    """
     supabase, user = auth
     
     try:
-        response = supabase.table("whiteboards") \
-            .select("*") \
-            .eq("user_id", user.id) \
+        query = supabase.table("whiteboards") \
+            .select(WHITEBOARD_LIST_COLUMNS) \
+            .eq("user_id", user.id)
+
+        if cursor:
+            try:
+                after_updated_at, after_id = decode_list_cursor(cursor)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            # Keyset on (updated_at, id) to match whiteboards_user_updated_idx
+            query = query.or_(
+                f'updated_at.lt."{after_updated_at}",'
+                f'and(updated_at.eq."{after_updated_at}",id.lt.{after_id})'
+            )
+
+        query = query \
             .order("updated_at", desc=True) \
-            .execute()
+            .order("id", desc=True) \
+            .limit(limit + 1)
+        response = await db_executor.run(query.execute)
+
+        rows = response.data
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_list_cursor(rows[-1]["updated_at"], rows[-1]["id"])
         
-        return {"whiteboards": response.data}
+        return {"whiteboards": rows, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -310,9 +546,9 @@ async def create_whiteboard(
             }
         }
         
-        response = supabase.table("whiteboards") \
-            .insert(data) \
-            .execute()
+        query = supabase.table("whiteboards") \
+            .insert(data)
+        response = await db_executor.run(query.execute)
         
         if response.data:
             return {"whiteboard": response.data[0]}
@@ -327,22 +563,70 @@ async def create_whiteboard(
 @app.get("/api/whiteboards/{whiteboard_id}")
 async def get_whiteboard(
     whiteboard_id: str,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
     auth: tuple = Depends(get_supabase_client)
 ):
-    """Get a specific whiteboard by ID."""
+    """
+    Get a specific whiteboard by ID. Responses carry a strong ETag derived
+    from updated_at and the content encoding; a matching If-None-Match gets
+    304 without the body.
+    """
     supabase, user = auth
     
     try:
-        response = supabase.table("whiteboards") \
-            .select("*") \
+        # Read-after-write: land any buffered save before reading
+        if write_buffer is not None:
+            await write_buffer.flush(whiteboard_id)
+
+        # Cheap lookup first: it enforces RLS and yields the ETag
+        query = supabase.table("whiteboards") \
+            .select("updated_at") \
             .eq("id", whiteboard_id) \
-            .single() \
-            .execute()
+            .single()
+        response = await db_executor.run(query.execute)
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Whiteboard not found")
-        
-        return {"whiteboard": response.data}
+
+        updated_at = response.data["updated_at"]
+        etag = make_etag(whiteboard_id, updated_at)
+        encoding = negotiate_encoding(accept_encoding)
+        headers = {
+            "Cache-Control": "private, no-cache",
+            "Vary": "Accept-Encoding, Authorization",
+        }
+        if etag_matches(if_none_match, etag):
+            headers["ETag"] = make_etag(whiteboard_id, updated_at, encoding)
+            return Response(status_code=304, headers=headers)
+
+        # Serializing or compressing a multi-MB board runs on the pool, off the event loop
+        cached = whiteboard_body_cache.get_ready(whiteboard_id, etag, encoding)
+        if cached is None:
+            cached = await db_executor.run(whiteboard_body_cache.get, whiteboard_id, etag, encoding)
+        if cached is None:
+            query = supabase.table("whiteboards") \
+                .select("*") \
+                .eq("id", whiteboard_id) \
+                .single()
+            response = await db_executor.run(query.execute)
+            if not response.data:
+                raise HTTPException(status_code=404, detail="Whiteboard not found")
+            # The row may have changed since the first lookup
+            updated_at = response.data["updated_at"]
+            etag = make_etag(whiteboard_id, updated_at)
+            cached = await db_executor.run(
+                whiteboard_body_cache.put, whiteboard_id, etag, {"whiteboard": response.data}, encoding
+            )
+
+        body, content_encoding = cached
+        # Small bodies are sent uncompressed, so tag what was actually encoded
+        headers["ETag"] = make_etag(whiteboard_id, updated_at, content_encoding)
+        if content_encoding:
+            headers["Content-Encoding"] = content_encoding
+        return Response(content=body, media_type="application/json", headers=headers)
+    except WriteBufferFlushError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -353,9 +637,13 @@ async def get_whiteboard(
 async def update_whiteboard(
     whiteboard_id: str,
     whiteboard: WhiteboardUpdate,
+    authorization: str = Header(...),
     auth: tuple = Depends(get_supabase_client)
 ):
-    """Update a whiteboard."""
+    """
+    Update a whiteboard. With the write buffer enabled the write is acknowledged
+    before it is flushed; a failed earlier flush for the board surfaces as 503.
+    """
     supabase, user = auth
     
     try:
@@ -367,17 +655,90 @@ async def update_whiteboard(
         
         if not update_data:
             raise HTTPException(status_code=400, detail="No fields to update")
+
+        if write_buffer is not None:
+            # Only the owner's saves are buffered, so an acknowledged save has a row to land in
+            query = supabase.table("whiteboards") \
+                .select("id") \
+                .eq("id", whiteboard_id) \
+                .eq("user_id", user.id)
+            response = await db_executor.run(query.execute)
+            if not response.data:
+                raise HTTPException(status_code=404, detail="Whiteboard not found")
+
+            # Rapid autosaves are merged and written by the buffer
+            pending = await write_buffer.submit(whiteboard_id, user.id, _bearer_token(authorization), update_data)
+            return {"whiteboard": {"id": whiteboard_id}, "buffered": True, "pending_updates": pending}
         
-        response = supabase.table("whiteboards") \
+        query = supabase.table("whiteboards") \
             .update(update_data) \
             .eq("id", whiteboard_id) \
-            .eq("user_id", user.id) \
-            .execute()
+            .eq("user_id", user.id)
+        response = await db_executor.run(query.execute)
         
         if response.data:
             return {"whiteboard": response.data[0]}
         
         raise HTTPException(status_code=404, detail="Whiteboard not found")
+    except WriteBufferFlushError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.patch("/api/whiteboards/{whiteboard_id}/elements")
+async def patch_whiteboard_elements(
+    whiteboard_id: str,
+    patch: WhiteboardPatch,
+    auth: tuple = Depends(get_supabase_client)
+):
+    """
+    Apply element-level upserts and deletes to a whiteboard. Elements are
+    matched by id; stale versions are rejected with 409 and the stored
+    versions so the client can rebase.
+    """
+    supabase, user = auth
+
+    if not patch.upserts and not patch.deletes and not patch.files and not patch.app_state:
+        raise HTTPException(status_code=400, detail="No changes to apply")
+
+    try:
+        if write_buffer is not None:
+            await write_buffer.flush(whiteboard_id)
+
+        # Merged inside Postgres (scripts/002_patch_whiteboard_elements.sql) under a row lock;
+        # only the elements array is read and stored files are never sent back and forth
+        query = supabase.rpc("patch_whiteboard_elements", {
+            "p_whiteboard_id": whiteboard_id,
+            "p_upserts": patch.upserts,
+            "p_deletes": [ref.model_dump() for ref in patch.deletes],
+            "p_files": patch.files or None,
+            "p_app_state": patch.app_state or None,
+        })
+        result = (await db_executor.run(query.execute)).data or {}
+        status = result.get("status")
+        if status == "not_found":
+            raise HTTPException(status_code=404, detail="Whiteboard not found")
+        if status == "stale":
+            raise StaleElementsError(result["stale"])
+        if status == "invalid":
+            raise ValueError(result.get("message", "Invalid patch"))
+        if status != "ok":
+            raise RuntimeError(f"Unexpected patch result: {result}")
+        whiteboard_body_cache.invalidate(whiteboard_id)
+        return {
+            "id": whiteboard_id,
+            "upserted": len(patch.upserts),
+            "deleted": len(patch.deletes),
+        }
+    except StaleElementsError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "stale": e.stale})
+    except WriteBufferFlushError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -393,11 +754,14 @@ async def delete_whiteboard(
     supabase, user = auth
     
     try:
-        response = supabase.table("whiteboards") \
+        query = supabase.table("whiteboards") \
             .delete() \
             .eq("id", whiteboard_id) \
-            .eq("user_id", user.id) \
-            .execute()
+            .eq("user_id", user.id)
+        response = await db_executor.run(query.execute)
+        whiteboard_body_cache.invalidate(whiteboard_id)
+        if write_buffer is not None:
+            write_buffer.discard(whiteboard_id)
         
         return {"success": True}
     except Exception as e:
@@ -419,7 +783,8 @@ async def rag_upload_pdf(
     
     try:
         # Save the uploaded file
-        path = save_uploaded_pdf(file)
+        with span("upload_write"):
+            path, file_hash, size = await save_uploaded_pdf(file)
         
         # Send event to Inngest for async processing
         event_id = await inngest_client.send(
@@ -429,6 +794,9 @@ async def rag_upload_pdf(
                     "pdf_path": str(path.resolve()),
                     "source_id": file.filename,
                     "user_id": user.id,
+                    # Lets ingest skip re-hashing the file
+                    "file_hash": file_hash,
+                    "trace_id": current_trace_id(),
                 },
             )
         )
@@ -436,8 +804,12 @@ async def rag_upload_pdf(
         return {
             "event_id": event_id[0],
             "filename": file.filename,
+            "file_hash": file_hash,
+            "size": size,
             "message": "PDF upload triggered for ingestion"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -449,60 +821,191 @@ async def rag_query(
 ):
     """Query the RAG system and get an AI-generated answer."""
     supabase, user = auth
-    print(f"DEBUG: rag_query hit with question: {request.question}")
+    logger.debug(f"rag_query question={request.question!r} trace_id={current_trace_id()}")
 
     try:
-        # Send event to Inngest
-        print("DEBUG: Sending event rag/query_pdf_ai to Inngest...")
-        event_id = await inngest_client.send(
-            inngest.Event(
-                name="rag/query_pdf_ai",
-                data={
-                    "question": request.question,
-                    "top_k": request.top_k,
-                    "user_id": user.id,
-                },
+        start = time.perf_counter()
+        timings = {}
+        version = corpus_version()
+        query_vec = None
+        if answer_cache is not None or RAG_QUERY_MODE == "direct":
+            query_vec = await embed_question(request.question)
+            timings["embed_ms"] = (time.perf_counter() - start) * 1000
+
+        if answer_cache is not None:
+            cached = answer_cache.lookup(request.question, version, answer_scope(user.id, request.top_k), query_vec)
+            if cached is not None:
+                logger.debug(f"rag_query answer cache hit trace_id={current_trace_id()}")
+                observe("query_total", time.perf_counter() - start, timings, "total_ms")
+                return {**cached, "cached": True, "mode": "cache", "timings": _round_timings(timings)}
+
+        if RAG_QUERY_MODE == "direct":
+            # Same search -> prompt -> LLM pipeline, without the Inngest round trip
+            output, stage_timings = await run_query(request.question, request.top_k, query_vec, user.id)
+            timings.update(stage_timings)
+            if answer_cache is not None:
+                answer_cache.store(request.question, version, output, answer_scope(user.id, request.top_k), query_vec)
+        else:
+            # Send event to Inngest
+            mark = time.perf_counter()
+            event_id = await inngest_client.send(
+                inngest.Event(
+                    name="rag/query_pdf_ai",
+                    data={
+                        "question": request.question,
+                        "top_k": request.top_k,
+                        "user_id": user.id,
+                        "trace_id": current_trace_id(),
+                    },
+                )
             )
-        )
-        print(f"DEBUG: Event sent, event_id: {event_id}")
+            timings["dispatch_ms"] = (time.perf_counter() - mark) * 1000
+            logger.debug(f"rag_query waiting for event_id={event_id[0]} trace_id={current_trace_id()}")
 
-        # Wait for the result
-        print(f"DEBUG: Waiting for run output for event_id: {event_id[0]}...")
-        output = await wait_for_run_output(event_id[0])
-        print(f"DEBUG: Output received: {output}")
+            # Wait for the result
+            with span("result_wait", timings, "wait_ms"):
+                output = await result_broker.wait(event_id[0], RAG_QUERY_TIMEOUT_S)
+            if answer_cache is not None:
+                # Stored here, where the question is already embedded, instead of re-embedding it in the function
+                answer_cache.store(request.question, version, output, answer_scope(user.id, request.top_k), query_vec)
 
+        observe("query_total", time.perf_counter() - start, timings, "total_ms")
         return {
             "answer": output.get("answer", ""),
             "sources": output.get("sources", []),
-            "num_contexts": output.get("num_contexts", 0)
+            "num_contexts": output.get("num_contexts", 0),
+            "mode": RAG_QUERY_MODE,
+            "timings": _round_timings(timings),
         }
     except TimeoutError as e:
-        print(f"ERROR in rag_query: TimeoutError: {e}")
+        logger.warning(f"rag_query timed out trace_id={current_trace_id()}: {e}")
         raise HTTPException(status_code=504, detail=str(e))
-    except RuntimeError as e:
-        print(f"ERROR in rag_query: RuntimeError: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception as e:
+        logger.exception(f"rag_query failed trace_id={current_trace_id()}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/rag/query/batch")
+async def rag_query_batch(
+    request: RAGBatchQueryRequest,
+    auth: tuple = Depends(get_supabase_client)
+):
+    """
+    Answer a list of questions (e.g. a quiz or flashcard set) in one request.
+    All questions are embedded together and searched in one batched request,
+    and the LLM calls then run concurrently. Answers are in question order.
+    """
+    supabase, user = auth
+    logger.debug(f"rag_query_batch questions={len(request.questions)} trace_id={current_trace_id()}")
+
+    try:
+        start = time.perf_counter()
+        version = corpus_version()
+        scope = answer_scope(user.id, request.top_k)
+        query_vecs = await embed_questions(request.questions)
+        timings = {"embed_ms": (time.perf_counter() - start) * 1000}
+
+        results: list[Optional[dict]] = [None] * len(request.questions)
+        misses = []
+        for i, (question, query_vec) in enumerate(zip(request.questions, query_vecs)):
+            cached = answer_cache.lookup(question, version, scope, query_vec) if answer_cache is not None else None
+            if cached is not None:
+                results[i] = {"question": question, **cached, "cached": True}
+            else:
+                misses.append(i)
+
+        if misses:
+            answered, stage_timings = await run_query_batch(
+                [request.questions[i] for i in misses],
+                request.top_k,
+                [query_vecs[i] for i in misses],
+                user.id,
+            )
+            timings.update(stage_timings)
+            for i, result in zip(misses, answered):
+                results[i] = result
+                if answer_cache is not None and "error" not in result:
+                    cached_fields = {k: result[k] for k in ("answer", "sources", "num_contexts")}
+                    answer_cache.store(result["question"], version, cached_fields, scope, query_vecs[i])
+
+        observe("batch_total", time.perf_counter() - start, timings, "total_ms")
+        return {
+            "results": results,
+            "cached": len(results) - len(misses),
+            "timings": _round_timings(timings),
+        }
     except Exception as e:
-        print(f"ERROR in rag_query: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"rag_query_batch failed trace_id={current_trace_id()}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/rag/query/stream")
+async def rag_query_stream(
+    request: RAGQueryRequest,
+    auth: tuple = Depends(get_supabase_client)
+):
+    """
+    Query the RAG system and stream the answer as Server-Sent Events:
+    `sources` first, then one `token` event per LLM delta, then `done`.
+    """
+    supabase, user = auth
+    version = corpus_version()
+
+    async def events():
+        try:
+            query_vec = await embed_question(request.question)
+            if answer_cache is not None:
+                cached = answer_cache.lookup(request.question, version, answer_scope(user.id, request.top_k), query_vec)
+                if cached is not None:
+                    yield _sse("sources", {"sources": cached["sources"], "num_contexts": cached["num_contexts"]})
+                    yield _sse("token", {"text": cached["answer"]})
+                    yield _sse("done", {**cached, "cached": True})
+                    return
+
+            found = await search_contexts(request.question, request.top_k, query_vec, user.id)
+            yield _sse("sources", {"sources": found.sources, "num_contexts": len(found.contexts)})
+
+            parts = []
+            async for token in llm_stream(build_user_content(request.question, found.contexts)):
+                parts.append(token)
+                yield _sse("token", {"text": token})
+
+            answer = "".join(parts).strip()
+            if not answer:
+                raise RuntimeError("Groq returned no text.")
+            result = {"answer": answer, "sources": found.sources, "num_contexts": len(found.contexts)}
+            if answer_cache is not None:
+                answer_cache.store(request.question, version, result, answer_scope(user.id, request.top_k), query_vec)
+            yield _sse("done", result)
+        except Exception as e:
+            logger.exception(f"rag_query_stream failed trace_id={current_trace_id()}")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream into one response
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/rag/status/{event_id}")
 async def rag_status(
     event_id: str,
     auth: tuple = Depends(get_supabase_client)
 ):
     """Check the status of a RAG operation."""
-    # Check local cache first
-    if event_id in run_results:
-        return {"status": "Completed", "output": run_results[event_id]}
+    # Check the result broker first
+    output = await result_broker.get(event_id)
+    if output is not None:
+        return {"status": "Completed", "output": output}
 
     try:
-        runs = fetch_runs(event_id)
+        runs = await fetch_runs(event_id)
         if not runs:
             return {"status": "pending", "output": None}
         
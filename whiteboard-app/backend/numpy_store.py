@@ -0,0 +1,382 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from config import NUMPY_STORE_COMPACT_RATIO
+from vector_db import format_search_result, bump_corpus_version
+
+logger = logging.getLogger(__name__)
+
+_INITIAL_CAPACITY = 1024
+
+
+class NumpyVectorStorage:
+    """
+    Embedded vector store with the same surface as QdrantStorage.
+
+    Vectors are L2-normalized and kept in a memory-mapped float32 (or int8)
+    matrix; payloads live in an append-only JSONL sidecar where the last line
+    for an id wins. Search is exact cosine top-k via one matrix-vector product
+    and argpartition, which makes it a recall baseline for the ANN index.
+    Rows are also indexed by payload `user_id` so tenant-filtered searches
+    only score that user's vectors. Deleted points leave a tombstone line
+    (a null payload) and their rows are skipped by search. Once
+    `compact_ratio` of the sidecar's lines are superseded or tombstones, the
+    store is rewritten with only live rows.
+
+    Files are opened on first use and created only by a write, so queries
+    against a collection that was never written find it empty and leave
+    nothing on disk.
+    """
+
+    def __init__(
+        self,
+        path: str = "vector_store",
+        collection: str = "docs",
+        dim: int = 1024,
+        quantized: bool = False,
+        compact_ratio: float = NUMPY_STORE_COMPACT_RATIO,
+    ):
+        self.root = Path(path)
+        self.collection = collection
+        self.dim = dim
+        self.quantized = quantized
+        self.compact_ratio = compact_ratio
+        self.dtype = np.int8 if quantized else np.float32
+
+        self._meta_path = self.root / f"{collection}.meta.json"
+        self._vectors_path = self.root / f"{collection}.{'i8' if quantized else 'f32'}"
+        self._payloads_path = self.root / f"{collection}.payloads.jsonl"
+        self._lock = threading.RLock()
+
+        self.count = 0
+        self.capacity = _INITIAL_CAPACITY
+        self._matrix = None
+        self._reset_index()
+
+    def _open(self, create: bool = False) -> bool:
+        """
+        Open the store's files on first use. Returns False, without touching
+        the disk, if the store does not exist yet and `create` is not set.
+        """
+        with self._lock:
+            if self._matrix is not None:
+                return True
+            if self._meta_path.exists():
+                meta = json.loads(self._meta_path.read_text())
+                if meta["dim"] != self.dim or meta["quantized"] != self.quantized:
+                    raise ValueError(
+                        f"Store '{self.collection}' has dim={meta['dim']} quantized={meta['quantized']}, "
+                        f"expected dim={self.dim} quantized={self.quantized}"
+                    )
+                self.count = meta["count"]
+                self.capacity = meta["capacity"]
+            elif not create:
+                return False
+            else:
+                self.root.mkdir(parents=True, exist_ok=True)
+
+            self._open_matrix()
+            self._load_payloads()
+            if create:
+                self._save_meta()
+            logger.info(f"Opened numpy store '{self.collection}' at '{self.root}' with {self.count} vectors")
+            return True
+
+    def _open_matrix(self):
+        mode = "r+" if self._vectors_path.exists() else "w+"
+        self._matrix = np.memmap(self._vectors_path, dtype=self.dtype, mode=mode, shape=(self.capacity, self.dim))
+
+    def _grow(self, needed: int):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+        self._matrix.flush()
+        del self._matrix
+        with open(self._vectors_path, "r+b") as f:
+            f.truncate(capacity * self.dim * np.dtype(self.dtype).itemsize)
+        self.capacity = capacity
+        self._open_matrix()
+
+    def _index_row(self, row: int, payload):
+        old = self._payloads[row]
+        if old and old.get("user_id") is not None:
+            self._user_rows.get(old["user_id"], set()).discard(row)
+        if payload and payload.get("user_id") is not None:
+            self._user_rows.setdefault(payload["user_id"], set()).add(row)
+
+    def _reset_index(self):
+        self._rows: dict[str, int] = {}
+        self._user_rows: dict[str, set[int]] = {}
+        self._deleted: set[int] = set()
+        self._ids: list = [None] * self.count
+        self._payloads: list = [None] * self.count
+        # Lines in the sidecar, live or not; compared with len(self._rows) to decide when to compact
+        self._lines = 0
+
+    def _load_payloads(self):
+        self._reset_index()
+        if not self._payloads_path.exists():
+            return
+        with open(self._payloads_path, encoding="utf-8") as f:
+            for line in f:
+                self._lines += 1
+                record = json.loads(line)
+                row = record["row"]
+                if row >= self.count:
+                    # Written after the last committed count; the vector may be incomplete
+                    continue
+                self._index_row(row, record["payload"])
+                if record["payload"] is None:
+                    self._rows.pop(record["id"], None)
+                    self._ids[row] = None
+                    self._payloads[row] = None
+                    self._deleted.add(row)
+                    continue
+                self._rows[record["id"]] = row
+                self._ids[row] = record["id"]
+                self._payloads[row] = record["payload"]
+
+    def _save_meta(self):
+        meta = {"dim": self.dim, "quantized": self.quantized, "count": self.count, "capacity": self.capacity}
+        tmp = self._meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta))
+        tmp.replace(self._meta_path)
+
+    def _encode(self, vectors) -> np.ndarray:
+        arr = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(arr, axis=1, keepdims=True)
+        arr = arr / np.where(norms == 0, 1, norms)
+        if self.quantized:
+            # Unit vectors have components in [-1, 1], so a fixed 127 scale suffices
+            return np.clip(np.rint(arr * 127), -127, 127).astype(np.int8)
+        return arr
+
+    def ensure_collection(self):
+        self._open(create=True)
+
+    def invalidate(self):
+        pass
+
+    def upsert(self, ids, vectors, payloads, wait: bool = True):
+        """Upsert vectors with their payloads into the store."""
+        self.bulk_upsert(ids, vectors, payloads, wait=wait)
+
+    def bulk_upsert(self, ids, vectors, payloads, batch_size: int = None, wait: bool = True):
+        if len(ids) != len(vectors) or len(vectors) != len(payloads):
+            raise ValueError("ids, vectors, and payloads must have the same length")
+        if not ids:
+            return []
+
+        # Last occurrence of a repeated id wins, so one call never gives an id two rows
+        latest = {str(point_id): i for i, point_id in enumerate(ids)}
+        if len(latest) < len(ids):
+            keep = sorted(latest.values())
+            ids = [ids[i] for i in keep]
+            vectors = [vectors[i] for i in keep]
+            payloads = [payloads[i] for i in keep]
+
+        start = time.perf_counter()
+        encoded = self._encode(vectors)
+        with self._lock:
+            self._open(create=True)
+            rows = []
+            next_row = self.count
+            for point_id in ids:
+                row = self._rows.get(str(point_id))
+                if row is None:
+                    row = next_row
+                    next_row += 1
+                rows.append(row)
+            self._grow(next_row)
+            self._matrix[rows] = encoded
+
+            new_rows = next_row - self.count
+            self._ids.extend([None] * new_rows)
+            self._payloads.extend([None] * new_rows)
+            with open(self._payloads_path, "a", encoding="utf-8") as f:
+                for point_id, row, payload in zip(ids, rows, payloads):
+                    point_id = str(point_id)
+                    self._rows[point_id] = row
+                    self._ids[row] = point_id
+                    self._index_row(row, payload)
+                    self._payloads[row] = payload
+                    f.write(json.dumps({"row": row, "id": point_id, "payload": payload}) + "\n")
+            self._lines += len(ids)
+
+            if wait:
+                self._matrix.flush()
+            self.count = next_row
+            self._save_meta()
+            self._maybe_compact()
+        bump_corpus_version()
+
+        logger.info(f"Successfully upserted {len(ids)} points to numpy store '{self.collection}'")
+        return [{"batch": 0, "points": len(ids), "seconds": time.perf_counter() - start}]
+
+    def existing_ids(self, ids) -> set[str]:
+        with self._lock:
+            if not self._open():
+                return set()
+            return {str(point_id) for point_id in ids if str(point_id) in self._rows}
+
+    def _append_records(self, records):
+        with open(self._payloads_path, "a", encoding="utf-8") as f:
+            for row, point_id, payload in records:
+                f.write(json.dumps({"row": row, "id": point_id, "payload": payload}) + "\n")
+        self._lines += len(records)
+
+    def _maybe_compact(self):
+        # Small stores are left alone; rewriting them would cost more than the dead lines do
+        dead = self._lines - len(self._rows)
+        if self._lines >= _INITIAL_CAPACITY and dead >= self._lines * self.compact_ratio:
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrite the matrix and sidecar with only live rows, dropping tombstones
+        and superseded payload lines. Both are written to temporary files and
+        swapped in before the new count is committed.
+        """
+        with self._lock:
+            if not self._open():
+                return
+            live = sorted(self._rows.values())
+            capacity = _INITIAL_CAPACITY
+            while capacity < len(live):
+                capacity *= 2
+
+            vectors_tmp = self._vectors_path.with_name(self._vectors_path.name + ".compact")
+            matrix = np.memmap(vectors_tmp, dtype=self.dtype, mode="w+", shape=(capacity, self.dim))
+            if live:
+                matrix[:len(live)] = self._matrix[live]
+            matrix.flush()
+            del matrix
+
+            payloads_tmp = self._payloads_path.with_name(self._payloads_path.name + ".compact")
+            with open(payloads_tmp, "w", encoding="utf-8") as f:
+                for new_row, row in enumerate(live):
+                    f.write(json.dumps({"row": new_row, "id": self._ids[row], "payload": self._payloads[row]}) + "\n")
+
+            removed = self.count - len(live)
+            self._matrix.flush()
+            del self._matrix
+            os.replace(vectors_tmp, self._vectors_path)
+            os.replace(payloads_tmp, self._payloads_path)
+            self.count = len(live)
+            self.capacity = capacity
+            self._save_meta()
+            self._open_matrix()
+            self._load_payloads()
+        logger.info(f"Compacted numpy store '{self.collection}': {removed} dead rows removed, {self.count} kept")
+
+    def update_payloads(self, ids, payloads, wait: bool = True):
+        """Merge fields into each point's payload, leaving vectors alone."""
+        with self._lock:
+            if not self._open():
+                return
+            records = []
+            for point_id, fields in zip(ids, payloads):
+                row = self._rows.get(str(point_id))
+                if row is None:
+                    continue
+                payload = {**(self._payloads[row] or {}), **fields}
+                self._index_row(row, payload)
+                self._payloads[row] = payload
+                records.append((row, str(point_id), payload))
+            self._append_records(records)
+            self._maybe_compact()
+        bump_corpus_version()
+
+    def _document_rows(self, source_id: str, user_id: Optional[str]) -> list[int]:
+        return [
+            row for row in self._rows.values()
+            if self._payloads[row].get("source") == source_id and self._payloads[row].get("user_id") == user_id
+        ]
+
+    def has_document_version(self, source_id: str, file_hash: str, user_id: Optional[str] = None) -> bool:
+        with self._lock:
+            if not self._open():
+                return False
+            return any(self._payloads[row].get("file_hash") == file_hash for row in self._document_rows(source_id, user_id))
+
+    def delete_stale(self, source_id: str, file_hash: str, user_id: Optional[str] = None):
+        """Tombstone a document's points that do not belong to its `file_hash` version."""
+        with self._lock:
+            if not self._open():
+                return
+            stale = [row for row in self._document_rows(source_id, user_id) if self._payloads[row].get("file_hash") != file_hash]
+            records = []
+            for row in stale:
+                point_id = self._ids[row]
+                self._index_row(row, None)
+                del self._rows[point_id]
+                self._ids[row] = None
+                self._payloads[row] = None
+                self._deleted.add(row)
+                records.append((row, point_id, None))
+            self._append_records(records)
+            self._maybe_compact()
+        bump_corpus_version()
+        logger.info(f"Deleted {len(stale)} stale points of '{source_id}' from numpy store '{self.collection}'")
+
+    def _candidates(self, user_id: Optional[str]) -> Optional[np.ndarray]:
+        # None means every row is live and searchable
+        if user_id is not None:
+            return np.fromiter(sorted(self._user_rows.get(user_id, ())), dtype=np.int64)
+        if self._deleted:
+            return np.setdiff1d(np.arange(self.count), np.fromiter(self._deleted, dtype=np.int64))
+        return None
+
+    def _top_k(self, query_vectors, top_k: int, user_id: Optional[str] = None) -> list[tuple[list[int], list[float]]]:
+        """Top-k (rows, similarities) for each query, scored with one matrix product for the whole batch."""
+        candidates = self._candidates(user_id)
+        n = self.count if candidates is None else len(candidates)
+        if n == 0 or top_k <= 0 or len(query_vectors) == 0:
+            return [([], []) for _ in query_vectors]
+        queries = self._encode(query_vectors)
+        matrix = self._matrix[:self.count] if candidates is None else self._matrix[candidates]
+        if self.quantized:
+            scores = matrix.astype(np.int32) @ queries.astype(np.int32).T
+        else:
+            scores = matrix @ queries.T
+        k = min(top_k, n)
+        results = []
+        for column in scores.T:
+            # Partial selection is O(n); only the k winners get sorted
+            top = np.argpartition(-column, k - 1)[:k]
+            top = top[np.argsort(-column[top])]
+            # Undo the int8 scale so scores are cosine similarities either way
+            similarities = column[top] / (127 * 127) if self.quantized else column[top]
+            rows = top if candidates is None else candidates[top]
+            results.append((rows.tolist(), similarities.astype(float).tolist()))
+        return results
+
+    def search(self, query_vector, top_k: int = 3, user_id: Optional[str] = None):
+        """Exact cosine search returning contexts and sources, limited to user_id's vectors when given."""
+        return self.search_batch([query_vector], top_k, user_id)[0]
+
+    def search_batch(self, query_vectors, top_k: int = 3, user_id: Optional[str] = None) -> list[dict]:
+        with self._lock:
+            if not self._open():
+                return [format_search_result([], []) for _ in query_vectors]
+            return [
+                format_search_result([self._payloads[r] for r in rows], scores)
+                for rows, scores in self._top_k(query_vectors, top_k, user_id)
+            ]
+
+    def get_collection_info(self):
+        self._open()
+        return {
+            "name": self.collection,
+            "vectors_count": self.count - len(self._deleted),
+            "vectors_config": {"size": self.dim, "distance": "Cosine", "dtype": np.dtype(self.dtype).name},
+        }
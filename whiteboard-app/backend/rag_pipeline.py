@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, Optional
+
+from dotenv import load_dotenv
+from groq import AsyncGroq
+
+from config import (
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_TTL_S,
+    ANSWER_CACHE_SIMILARITY,
+    CONTEXT_TOKEN_BUDGET,
+    RAG_BATCH_LLM_CONCURRENCY,
+)
+from answer_cache import AnswerCache
+from context_packer import pack_contexts
+from custom_types import RAGSearchResult
+from data_loader import embed_texts
+from executors import embed_executor
+from telemetry import TOKENS, observe, record_usage, span
+from vector_db import get_async_storage, tenant_collection
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Groq client reads GROQ_API_KEY from environment; async only, so no call can block the event loop
+async_groq_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+
+SYSTEM_PROMPT = "You are a helpful assistant. Answer questions using the provided context when relevant. If the answer IS found in the context, cite it. If the answer is NOT in the context, you may still answer using your general knowledge but clearly warn the user with: '⚠️ Note: This answer is from my general knowledge, not from your uploaded documents.'"
+
+# Answers keyed on question text/embedding and invalidated when the corpus changes
+answer_cache = (
+    AnswerCache(
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        ttl_s=ANSWER_CACHE_TTL_S,
+        similarity_threshold=ANSWER_CACHE_SIMILARITY,
+    )
+    if ANSWER_CACHE_ENABLED
+    else None
+)
+
+
+def answer_scope(user_id: Optional[str], top_k: int) -> str:
+    # Each user searches only their own documents, so cached answers are per user
+    return f"{user_id or ''}:{top_k}"
+
+
+async def embed_question(question: str) -> list[float]:
+    return (await embed_executor.run(embed_texts, [question], stage="embed_query"))[0]
+
+
+async def embed_questions(questions: list[str]) -> list[list[float]]:
+    # One embed_texts call; the engine splits it into as few Cohere requests as the batch size allows
+    return await embed_executor.run(embed_texts, questions, stage="embed_query")
+
+
+def _packed_result(found: dict) -> RAGSearchResult:
+    packed = pack_contexts(found["hits"], CONTEXT_TOKEN_BUDGET)
+    TOKENS.labels(kind="context").inc(sum(block["tokens"] for block in packed))
+    sources = list(dict.fromkeys(block["source"] for block in packed))
+    return RAGSearchResult(contexts=[block["text"] for block in packed], sources=sources)
+
+
+async def search_contexts(
+    question: str,
+    top_k: int = 3,
+    query_vec: Optional[list[float]] = None,
+    user_id: Optional[str] = None,
+) -> RAGSearchResult:
+    """
+    Search user_id's documents (every document when user_id is None) for the
+    question and pack the hits into deduplicated contexts within
+    CONTEXT_TOKEN_BUDGET.
+    """
+    try:
+        if query_vec is None:
+            query_vec = await embed_question(question)
+        with span("search"):
+            found = await get_async_storage(tenant_collection(user_id)).search(query_vec, top_k, user_id=user_id)
+        return _packed_result(found)
+    except Exception as e:
+        # If collection doesn't exist or search fails, return empty results
+        logger.warning(f"Search failed: {e}")
+        return RAGSearchResult(contexts=[], sources=[])
+
+
+async def search_contexts_batch(
+    query_vecs: list[list[float]],
+    top_k: int = 3,
+    user_id: Optional[str] = None,
+) -> list[RAGSearchResult]:
+    """search_contexts for many questions with one batched vector-store request."""
+    try:
+        with span("search_batch"):
+            found = await get_async_storage(tenant_collection(user_id)).search_batch(query_vecs, top_k, user_id=user_id)
+        return [_packed_result(f) for f in found]
+    except Exception as e:
+        logger.warning(f"Batch search failed: {e}")
+        return [RAGSearchResult(contexts=[], sources=[]) for _ in query_vecs]
+
+
+def build_user_content(question: str, contexts: list[str]) -> str:
+    with span("prompt"):
+        # Handle case where no PDFs are uploaded or no relevant contexts found
+        if not contexts:
+            logger.info(f"No relevant contexts found for question: {question}")
+            return (
+                f"Question: {question}\n\n"
+                "Note: No PDF documents have been uploaded yet, or the question is not related to any uploaded documents. "
+                "Please answer the question using your general knowledge, and clearly state that this information is not from uploaded documents."
+            )
+
+        logger.info(f"Found {len(contexts)} contexts for question: {question}")
+        context_block = "\n\n".join(f"- {c}" for c in contexts)
+        return (
+            "Use the following context to answer the question.\n\n"
+            f"Context:\n{context_block}\n\n"
+            f"Question: {question}\n"
+            "Answer concisely using the context above. If the answer is not contained in the context, answer the question, but specify that it is not from the sources given."
+        )
+
+
+def _messages(user_content: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_content},
+    ]
+
+
+def _answer_text(response) -> str:
+    record_usage(getattr(response, "usage", None))
+    text = response.choices[0].message.content
+    if not text:
+        raise RuntimeError("Groq returned no text.")
+    return text.strip()
+
+
+async def llm_answer_async(user_content: str) -> str:
+    with span("llm"):
+        response = await async_groq_client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=_messages(user_content),
+            temperature=0.2,
+            max_tokens=1024,
+        )
+    return _answer_text(response)
+
+
+async def llm_stream(user_content: str) -> AsyncIterator[str]:
+    """Yield answer tokens as Groq produces them."""
+    start = time.perf_counter()
+    first_token = True
+    with span("llm"):
+        stream = await async_groq_client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=_messages(user_content),
+            temperature=0.2,
+            max_tokens=1024,
+            stream=True,
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token:
+                    observe("llm_first_token", time.perf_counter() - start)
+                    first_token = False
+                yield chunk.choices[0].delta.content
+            # Groq reports usage on the final chunk
+            record_usage(getattr(getattr(chunk, "x_groq", None), "usage", None))
+
+
+async def run_query(
+    question: str,
+    top_k: int = 3,
+    query_vec: Optional[list[float]] = None,
+    user_id: Optional[str] = None,
+) -> tuple[dict, dict]:
+    """
+    Run search -> prompt -> LLM in-process. Returns the result and per-stage
+    timings in milliseconds.
+    """
+    timings = {}
+    start = time.perf_counter()
+    if query_vec is None:
+        query_vec = await embed_question(question)
+        timings["embed_ms"] = (time.perf_counter() - start) * 1000
+
+    mark = time.perf_counter()
+    found = await search_contexts(question, top_k, query_vec, user_id)
+    timings["search_ms"] = (time.perf_counter() - mark) * 1000
+
+    mark = time.perf_counter()
+    user_content = build_user_content(question, found.contexts)
+    timings["prompt_ms"] = (time.perf_counter() - mark) * 1000
+
+    mark = time.perf_counter()
+    answer = await llm_answer_async(user_content)
+    timings["llm_ms"] = (time.perf_counter() - mark) * 1000
+    timings["total_ms"] = (time.perf_counter() - start) * 1000
+
+    result = {"answer": answer, "sources": found.sources, "num_contexts": len(found.contexts)}
+    return result, timings
+
+
+async def run_query_batch(
+    questions: list[str],
+    top_k: int = 3,
+    query_vecs: Optional[list[list[float]]] = None,
+    user_id: Optional[str] = None,
+    max_concurrency: int = RAG_BATCH_LLM_CONCURRENCY,
+) -> tuple[list[dict], dict]:
+    """
+    Answer many questions with one embedding call, one batched search and at
+    most `max_concurrency` LLM calls in flight. Results are in input order; a
+    question whose LLM call fails gets an `error` instead of failing the batch.
+    """
+    timings = {}
+    start = time.perf_counter()
+    if query_vecs is None:
+        query_vecs = await embed_questions(questions)
+        timings["embed_ms"] = (time.perf_counter() - start) * 1000
+
+    mark = time.perf_counter()
+    found = await search_contexts_batch(query_vecs, top_k, user_id)
+    timings["search_ms"] = (time.perf_counter() - mark) * 1000
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _answer(question: str, contexts: RAGSearchResult) -> dict:
+        async with semaphore:
+            try:
+                answer = await llm_answer_async(build_user_content(question, contexts.contexts))
+            except Exception as e:
+                logger.warning(f"LLM call failed for batch question: {e}")
+                return {"question": question, "error": str(e)}
+        return {"question": question, "answer": answer, "sources": contexts.sources, "num_contexts": len(contexts.contexts)}
+
+    mark = time.perf_counter()
+    results = await asyncio.gather(*(_answer(q, f) for q, f in zip(questions, found)))
+    timings["llm_ms"] = (time.perf_counter() - mark) * 1000
+    timings["total_ms"] = (time.perf_counter() - start) * 1000
+    return list(results), timings
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _resolve(future: asyncio.Future, result: dict):
+    # The waiter may have timed out between scheduling and running this callback
+    if not future.done():
+        future.set_result(result)
+
+
+class InProcessResultBackend:
+    """
+    Results held in this process. Waiters park on futures that are resolved
+    the moment a result is stored; results expire after `ttl_s`.
+    """
+
+    def __init__(self, ttl_s: float = 600):
+        self.ttl_s = ttl_s
+        # Insertion order equals expiry order because every entry shares one TTL
+        self._results: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._waiters: dict[str, set[asyncio.Future]] = {}
+
+    def _prune(self):
+        now = time.monotonic()
+        while self._results:
+            event_id, (expires, _) = next(iter(self._results.items()))
+            if expires > now:
+                break
+            del self._results[event_id]
+
+    async def put(self, event_id: str, result: dict):
+        self._prune()
+        self._results[event_id] = (time.monotonic() + self.ttl_s, result)
+        self._results.move_to_end(event_id)
+        for future in self._waiters.pop(event_id, ()):
+            future.get_loop().call_soon_threadsafe(_resolve, future, result)
+
+    async def get(self, event_id: str) -> Optional[dict]:
+        self._prune()
+        entry = self._results.get(event_id)
+        return entry[1] if entry else None
+
+    async def wait(self, event_id: str, timeout_s: float) -> dict:
+        existing = await self.get(event_id)
+        if existing is not None:
+            return existing
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(event_id, set()).add(future)
+        try:
+            return await asyncio.wait_for(future, timeout_s)
+        finally:
+            # Drop abandoned waiters (timeout, client disconnect) so they do not accumulate
+            waiters = self._waiters.get(event_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[event_id]
+
+    def stats(self) -> dict:
+        return {
+            "results": len(self._results),
+            "waiting_events": len(self._waiters),
+            "waiters": sum(len(w) for w in self._waiters.values()),
+        }
+
+
+class RedisResultBackend:
+    """
+    Results shared across uvicorn workers through Redis (or any server that
+    speaks its protocol). Values are stored with an expiry and announced on a
+    per-event channel so waiters in other processes wake up immediately.
+    """
+
+    def __init__(self, url: str, ttl_s: float = 600, prefix: str = "rag:result:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("RESULT_BROKER_URL requires the 'redis' package") from e
+        self._redis = redis.from_url(url)
+        self.ttl_s = ttl_s
+        self.prefix = prefix
+
+    async def put(self, event_id: str, result: dict):
+        data = json.dumps(result)
+        key = self.prefix + event_id
+        await self._redis.set(key, data, ex=int(self.ttl_s))
+        await self._redis.publish(key, data)
+
+    async def get(self, event_id: str) -> Optional[dict]:
+        data = await self._redis.get(self.prefix + event_id)
+        return json.loads(data) if data else None
+
+    async def wait(self, event_id: str, timeout_s: float) -> dict:
+        key = self.prefix + event_id
+        pubsub = self._redis.pubsub()
+        # Subscribe before reading so a result published in between is not missed
+        await pubsub.subscribe(key)
+        try:
+            existing = await self.get(event_id)
+            if existing is not None:
+                return existing
+
+            async def _next_message() -> dict:
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        return json.loads(message["data"])
+
+            return await asyncio.wait_for(_next_message(), timeout_s)
+        finally:
+            await pubsub.unsubscribe(key)
+            await pubsub.aclose()
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+class ResultBroker:
+    """Hands Inngest function results to the request handlers waiting on them."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def publish(self, event_id: str, result: dict):
+        await self.backend.put(event_id, result)
+
+    async def get(self, event_id: str) -> Optional[dict]:
+        return await self.backend.get(event_id)
+
+    async def wait(self, event_id: str, timeout_s: float = 60.0) -> dict:
+        try:
+            return await self.backend.wait(event_id, timeout_s)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Timed out waiting for run output for event_id {event_id}")
+
+    def stats(self) -> dict:
+        return self.backend.stats()
+
+
+def create_result_broker(url: str = "", ttl_s: float = 600) -> ResultBroker:
+    if url:
+        logger.info("Using Redis result broker")
+        return ResultBroker(RedisResultBackend(url, ttl_s=ttl_s))
+    return ResultBroker(InProcessResultBackend(ttl_s=ttl_s))
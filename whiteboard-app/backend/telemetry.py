@@ -0,0 +1,115 @@
+import contextvars
+import logging
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = "X-Trace-Id"
+
+# Caller-supplied ids end up in logs and response headers, so only plain hex/uuid-like ids are kept
+_TRACE_ID_PATTERN = re.compile(r"[0-9a-fA-F-]{8,64}")
+
+# Covers sub-millisecond prompt builds up to multi-minute ingest windows
+_STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Wall time of one RAG pipeline stage",
+    ["stage"],
+    buckets=_STAGE_BUCKETS,
+)
+CHUNKS = Counter("rag_chunks", "Chunks handled by ingest, by whether they were embedded or reused", ["result"])
+TOKENS = Counter("rag_tokens", "Tokens sent to or produced by the LLM, and context tokens packed into prompts", ["kind"])
+
+# Trace id of the request or Inngest run being handled; executors copy it into worker threads
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+def valid_trace_id(trace_id: Optional[str]) -> Optional[str]:
+    """trace_id if it is 8-64 hex digits or dashes, otherwise None."""
+    if trace_id and _TRACE_ID_PATTERN.fullmatch(trace_id):
+        return trace_id
+    return None
+
+
+def bind_trace_id(trace_id: Optional[str] = None) -> str:
+    """Make trace_id (or a fresh one) current for this task and return it."""
+    trace_id = trace_id or new_trace_id()
+    _trace_id.set(trace_id)
+    return trace_id
+
+
+def observe(stage: str, seconds: float, timings: Optional[dict] = None, key: Optional[str] = None) -> None:
+    """Record a finished stage; also store it in `timings` (in ms) when the caller reports per-request timings."""
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    if timings is not None:
+        timings[key or f"{stage}_ms"] = seconds * 1000
+    logger.debug(f"span stage={stage} duration_ms={seconds * 1000:.1f} trace_id={current_trace_id() or '-'}")
+
+
+@contextmanager
+def span(stage: str, timings: Optional[dict] = None, key: Optional[str] = None) -> Iterator[None]:
+    """Time the enclosed block as `stage`, whether it completes or raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, timings, key)
+
+
+def record_usage(usage) -> None:
+    """Count prompt/completion tokens from an OpenAI-style `usage` object, if the response had one."""
+    if usage is None:
+        return
+    TOKENS.labels(kind="prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    TOKENS.labels(kind="completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+class StatsCollector:
+    """
+    Exposes the counters the caches and executor pools already keep, read at
+    scrape time, so they need no Prometheus calls on their hot paths.
+    """
+
+    def __init__(self, caches: Callable[[], dict[str, dict]], executors: Callable[[], dict[str, dict]]):
+        self._caches = caches
+        self._executors = executors
+
+    def collect(self):
+        hits = CounterMetricFamily("rag_cache_hits", "Cache hits by cache and tier", labels=["cache", "tier"])
+        misses = CounterMetricFamily("rag_cache_misses", "Cache misses by cache", labels=["cache"])
+        for name, stats in self._caches().items():
+            for field, value in stats.items():
+                if field.endswith("_hits"):
+                    hits.add_metric([name, field[: -len("_hits")]], value)
+            misses.add_metric([name], stats.get("misses", 0))
+        yield hits
+        yield misses
+
+        active = GaugeMetricFamily("rag_executor_active", "Calls running on each executor pool", labels=["pool"])
+        queued = GaugeMetricFamily("rag_executor_queued", "Calls waiting for a thread on each executor pool", labels=["pool"])
+        for name, stats in self._executors().items():
+            active.add_metric([name], stats["active"])
+            queued.add_metric([name], stats["queued"])
+        yield active
+        yield queued
+
+
+def register_stats_collector(caches: Callable[[], dict[str, dict]], executors: Callable[[], dict[str, dict]]) -> None:
+    REGISTRY.register(StatsCollector(caches, executors))
@@ -1,70 +1,399 @@
+import asyncio
 import logging
-from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, PointStruct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from typing import Optional
+from qdrant_client.models import (
+    PointStruct,
+    Filter,
+    FieldCondition,
+    MatchValue,
+    KeywordIndexParams,
+    FilterSelector,
+    IsEmptyCondition,
+    PayloadField,
+    SetPayload,
+    SetPayloadOperation,
+    QueryRequest,
+)
+
+from config import (
+    QDRANT_URL,
+    QDRANT_COLLECTION,
+    QDRANT_PREFER_GRPC,
+    QDRANT_TIMEOUT,
+    VECTOR_BACKEND,
+    NUMPY_STORE_PATH,
+    NUMPY_STORE_QUANTIZED,
+    UPSERT_BATCH_SIZE,
+    UPSERT_MAX_CONCURRENCY,
+    UPSERT_WAIT,
+    VECTOR_TENANCY,
+    CORPUS_VERSION_PATH,
+)
+
+from corpus_version import CorpusVersionStore
+from collection_profiles import CollectionProfile, get_profile
+from executors import vector_executor
 
 logger = logging.getLogger(__name__)
 
+# Process-wide clients and storages, keyed by URL (and collection)
+_clients: dict[str, QdrantClient] = {}
+_async_clients: dict[str, AsyncQdrantClient] = {}
+_storages: dict[tuple[str, str], "QdrantStorage"] = {}
+_async_storages: dict[tuple[str, str], "AsyncQdrantStorage"] = {}
+# Collections already checked (or created) with the expected schema
+_ready_collections: set[tuple[str, str]] = set()
+# Serialize check-then-create per collection between threads of this process
+_ensure_locks: dict[tuple[str, str], threading.Lock] = {}
+_lock = threading.Lock()
+_upsert_executor: ThreadPoolExecutor = None
+# Bumped on every successful write so caches derived from search results can tell they are stale.
+# Kept in SQLite so writes from other workers and the bulk-ingest CLI are seen too.
+_corpus_version_store = CorpusVersionStore(CORPUS_VERSION_PATH) if CORPUS_VERSION_PATH else None
+_corpus_version = 0
+
+
+def corpus_version() -> int:
+    if _corpus_version_store is not None:
+        return _corpus_version_store.get()
+    return _corpus_version
+
+
+def bump_corpus_version() -> int:
+    global _corpus_version
+    if _corpus_version_store is not None:
+        return _corpus_version_store.bump()
+    with _lock:
+        _corpus_version += 1
+        return _corpus_version
+
+
+# Keyword indexes every collection gets; user_id is the tenant key so Qdrant co-locates each user's points
+PAYLOAD_INDEXES = {
+    "user_id": KeywordIndexParams(type="keyword", is_tenant=True),
+    "source": KeywordIndexParams(type="keyword"),
+    "file_hash": KeywordIndexParams(type="keyword"),
+}
+
+
+def tenant_collection(user_id: Optional[str] = None, collection: str = QDRANT_COLLECTION) -> str:
+    """Collection holding a user's vectors: the shared one, or one per user when VECTOR_TENANCY is "collection"."""
+    if VECTOR_TENANCY == "collection" and user_id:
+        return f"{collection}_{user_id}"
+    return collection
+
+
+def user_filter(user_id: Optional[str] = None) -> Optional[Filter]:
+    if not user_id:
+        return None
+    return Filter(must=[FieldCondition(key="user_id", match=MatchValue(value=user_id))])
+
+
+def _document_conditions(source_id: str, user_id: Optional[str]) -> list:
+    # Documents ingested without an owner are matched by the absence of user_id
+    owner = (
+        FieldCondition(key="user_id", match=MatchValue(value=user_id))
+        if user_id
+        else IsEmptyCondition(is_empty=PayloadField(key="user_id"))
+    )
+    return [FieldCondition(key="source", match=MatchValue(value=source_id)), owner]
+
+
+def get_qdrant_client(url: str = QDRANT_URL) -> QdrantClient:
+    """Shared client; its connection pool keeps connections alive across requests."""
+    with _lock:
+        if url not in _clients:
+            _clients[url] = QdrantClient(url=url, timeout=QDRANT_TIMEOUT, prefer_grpc=QDRANT_PREFER_GRPC)
+        return _clients[url]
+
+
+def get_async_qdrant_client(url: str = QDRANT_URL) -> AsyncQdrantClient:
+    with _lock:
+        if url not in _async_clients:
+            _async_clients[url] = AsyncQdrantClient(url=url, timeout=QDRANT_TIMEOUT, prefer_grpc=QDRANT_PREFER_GRPC)
+        return _async_clients[url]
+
+
+def _create_storage(collection: str, url: str):
+    if VECTOR_BACKEND == "numpy":
+        from numpy_store import NumpyVectorStorage
+        return NumpyVectorStorage(path=NUMPY_STORE_PATH, collection=collection, quantized=NUMPY_STORE_QUANTIZED)
+    return QdrantStorage(url=url, collection=collection)
+
+
+def get_storage(collection: str = QDRANT_COLLECTION, url: str = QDRANT_URL) -> "QdrantStorage":
+    """
+    Process-wide storage for VECTOR_BACKEND; for Qdrant the collection check
+    runs only on first use.
+    """
+    key = (url, collection)
+    storage = _storages.get(key)
+    if storage is None:
+        storage = _create_storage(collection, url)
+        with _lock:
+            storage = _storages.setdefault(key, storage)
+    return storage
+
+
+def get_async_storage(collection: str = QDRANT_COLLECTION, url: str = QDRANT_URL) -> "AsyncQdrantStorage":
+    key = (url, collection)
+    storage = _async_storages.get(key)
+    if storage is None:
+        if VECTOR_BACKEND == "numpy":
+            storage = _ThreadedAsyncStorage(get_storage(collection, url))
+        else:
+            storage = AsyncQdrantStorage(url=url, collection=collection)
+        with _lock:
+            storage = _async_storages.setdefault(key, storage)
+    return storage
+
+
+def _get_upsert_executor() -> ThreadPoolExecutor:
+    global _upsert_executor
+    with _lock:
+        if _upsert_executor is None:
+            _upsert_executor = ThreadPoolExecutor(max_workers=UPSERT_MAX_CONCURRENCY, thread_name_prefix="upsert")
+        return _upsert_executor
+
+
+def _point_batches(ids, vectors, payloads, batch_size):
+    if len(ids) != len(vectors) or len(vectors) != len(payloads):
+        raise ValueError("ids, vectors, and payloads must have the same length")
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    return [
+        [PointStruct(id=ids[i], vector=vectors[i], payload=payloads[i]) for i in range(start, min(start + batch_size, len(ids)))]
+        for start in range(0, len(ids), batch_size)
+    ]
+
+
+def _missing_payload_indexes(payload_schema) -> dict:
+    existing = set(payload_schema or {})
+    return {field: params for field, params in PAYLOAD_INDEXES.items() if field not in existing}
+
+
+def _batch_requests(query_vectors, top_k: int, user_id: Optional[str], params) -> list[QueryRequest]:
+    query_filter = user_filter(user_id)
+    return [
+        QueryRequest(query=vector, filter=query_filter, params=params, limit=top_k, with_payload=True)
+        for vector in query_vectors
+    ]
+
+
+def _format_batch(responses) -> list[dict]:
+    return [
+        format_search_result([r.payload for r in response.points], [r.score for r in response.points])
+        for response in responses
+    ]
+
+
+def _empty_results(n: int) -> list[dict]:
+    return [{"contexts": [], "sources": [], "hits": []} for _ in range(n)]
+
+
+def _check_vectors_config(collection: str, vectors_config, dim: int) -> None:
+    size = getattr(vectors_config, "size", None)
+    if size is not None and size != dim:
+        raise ValueError(f"Collection '{collection}' has dimension {size}, expected {dim}")
+
+
+def format_search_result(payloads, scores=None) -> dict:
+    """
+    Collapse hit payloads into the contexts/sources shape every backend
+    returns. `hits` keeps each hit's text, source, chunk index and score in
+    rank order for the context packer.
+    """
+    contexts = []
+    sources = set()
+    hits = []
+
+    payloads = list(payloads)
+    scores = list(scores) if scores is not None else [None] * len(payloads)
+    for payload, score in zip(payloads, scores):
+        payload = payload or {}
+        text = payload.get("text", "")
+        source = payload.get("source", "")
+        if text:
+            contexts.append(text)
+            sources.add(source)
+            hits.append({"text": text, "source": source, "chunk": payload.get("chunk"), "score": score})
+
+    logger.debug(f"Found {len(contexts)} contexts from {len(sources)} sources")
+    return {"contexts": contexts, "sources": list(sources), "hits": hits}
+
 
 class QdrantStorage:
-    def __init__(self, url="http://localhost:6333", collection="docs", dim=1024):
-        self.client = QdrantClient(url=url, timeout=30)
+    def __init__(self, url=QDRANT_URL, collection=QDRANT_COLLECTION, dim=1024, client=None, profile: Optional[CollectionProfile] = None):
+        self.client = client or get_qdrant_client(url)
+        self.url = url
         self.collection = collection
         self.dim = dim
+        # New collections are created with this profile; searches use its oversampling/rescoring
+        self.profile = profile or get_profile()
+
+    def ensure_collection(self):
+        """Create the collection or validate its schema, once per process."""
+        key = (self.url, self.collection)
+        if key in _ready_collections:
+            return
+
+        with _lock:
+            ensure_lock = _ensure_locks.setdefault(key, threading.Lock())
+        with ensure_lock:
+            if key in _ready_collections:
+                return
+            created = False
+            if not self.client.collection_exists(self.collection):
+                logger.info(
+                    f"Creating new collection '{self.collection}' with dimension {self.dim} (profile '{self.profile.name}')"
+                )
+                try:
+                    self.client.create_collection(
+                        collection_name=self.collection,
+                        vectors_config=self.profile.vectors_config(self.dim),
+                        hnsw_config=self.profile.hnsw_config(),
+                        quantization_config=self.profile.quantization_config(),
+                    )
+                    created = True
+                except Exception:
+                    # Another worker process created it between the check and the create
+                    if not self.client.collection_exists(self.collection):
+                        raise
+            if created:
+                missing = PAYLOAD_INDEXES
+            else:
+                info = self.client.get_collection(self.collection)
+                _check_vectors_config(self.collection, info.config.params.vectors, self.dim)
+                missing = _missing_payload_indexes(info.payload_schema)
+                logger.info(f"Using existing collection '{self.collection}'")
+            for field, params in missing.items():
+                logger.info(f"Creating payload index '{field}' on collection '{self.collection}'")
+                self.client.create_payload_index(self.collection, field, field_schema=params)
+            _ready_collections.add(key)
 
-        # Ensure collection exists with proper configuration
+    def _exists(self) -> bool:
+        """Read-side check: validate an existing collection, but never create one from a query."""
+        if (self.url, self.collection) in _ready_collections:
+            return True
         if not self.client.collection_exists(self.collection):
-            logger.info(f"Creating new collection '{self.collection}' with dimension {dim}")
-            self.client.create_collection(
-                collection_name=self.collection,
-                vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
-            )
-        else:
-            logger.info(f"Using existing collection '{self.collection}'")
+            return False
+        self.ensure_collection()
+        return True
 
-    def upsert(self, ids, vectors, payloads):
+    def invalidate(self):
+        """Forget the cached collection check, e.g. after the collection was dropped."""
+        _ready_collections.discard((self.url, self.collection))
+
+    def upsert(self, ids, vectors, payloads, wait: bool = UPSERT_WAIT):
         """Upsert vectors with their payloads into the collection."""
-        if len(ids) != len(vectors) or len(vectors) != len(payloads):
-            raise ValueError("ids, vectors, and payloads must have the same length")
+        self.bulk_upsert(ids, vectors, payloads, wait=wait)
+
+    def bulk_upsert(self, ids, vectors, payloads, batch_size: int = UPSERT_BATCH_SIZE, wait: bool = UPSERT_WAIT):
+        """
+        Upsert points in batches of `batch_size`, sent concurrently on a shared
+        pool. With wait=False Qdrant acknowledges each batch once it is written
+        rather than indexed. Returns per-batch timings.
+        """
+        batches = _point_batches(ids, vectors, payloads, batch_size)
+        self.ensure_collection()
+
+        def _send(index, points):
+            start = time.perf_counter()
+            self.client.upsert(self.collection, points=points, wait=wait)
+            return {"batch": index, "points": len(points), "seconds": time.perf_counter() - start}
 
         try:
-            points = [PointStruct(id=ids[i], vector=vectors[i], payload=payloads[i]) for i in range(len(ids))]
-            self.client.upsert(self.collection, points=points)
-            logger.info(f"Successfully upserted {len(points)} points to collection '{self.collection}'")
+            if len(batches) == 1:
+                timings = [_send(0, batches[0])]
+            else:
+                executor = _get_upsert_executor()
+                futures = [executor.submit(_send, i, points) for i, points in enumerate(batches)]
+                timings = [f.result() for f in futures]
+            bump_corpus_version()
+            logger.info(
+                f"Successfully upserted {len(ids)} points in {len(batches)} batches to collection '{self.collection}'"
+            )
+            return timings
         except Exception as e:
             logger.error(f"Failed to upsert points to collection '{self.collection}': {e}")
+            self.invalidate()
             raise
 
-    def search(self, query_vector, top_k: int = 3):
-        """Search for similar vectors and return contexts and sources."""
-        if not self.client.collection_exists(self.collection):
-            logger.warning(f"Collection '{self.collection}' does not exist, returning empty results")
-            return {"contexts": [], "sources": []}
+    def existing_ids(self, ids) -> set[str]:
+        """Ids among `ids` that are already stored."""
+        if not ids or not self._exists():
+            return set()
+        records = self.client.retrieve(self.collection, ids=ids, with_payload=False, with_vectors=False)
+        return {str(r.id) for r in records}
+
+    def update_payloads(self, ids, payloads, wait: bool = UPSERT_WAIT):
+        """Merge fields into each point's payload in one request, leaving vectors alone."""
+        if not ids:
+            return
+        operations = [
+            SetPayloadOperation(set_payload=SetPayload(payload=payload, points=[point_id]))
+            for point_id, payload in zip(ids, payloads)
+        ]
+        self.client.batch_update_points(self.collection, update_operations=operations, wait=wait)
+        bump_corpus_version()
 
+    def has_document_version(self, source_id: str, file_hash: str, user_id: Optional[str] = None) -> bool:
+        if not self._exists():
+            return False
+        conditions = _document_conditions(source_id, user_id)
+        conditions.append(FieldCondition(key="file_hash", match=MatchValue(value=file_hash)))
+        return self.client.count(self.collection, count_filter=Filter(must=conditions)).count > 0
+
+    def delete_stale(self, source_id: str, file_hash: str, user_id: Optional[str] = None):
+        """Delete a document's points that do not belong to its `file_hash` version."""
+        if not self._exists():
+            return
+        stale = Filter(
+            must=_document_conditions(source_id, user_id),
+            must_not=[FieldCondition(key="file_hash", match=MatchValue(value=file_hash))],
+        )
+        self.client.delete(self.collection, points_selector=FilterSelector(filter=stale), wait=True)
+        bump_corpus_version()
+
+    def search(self, query_vector, top_k: int = 3, user_id: Optional[str] = None):
+        """Search for similar vectors and return contexts and sources, limited to user_id's points when given."""
         try:
+            if not self._exists():
+                logger.warning(f"Collection '{self.collection}' does not exist, returning empty results")
+                return {"contexts": [], "sources": [], "hits": []}
             results = self.client.query_points(
                 collection_name=self.collection,
                 query=query_vector,
+                query_filter=user_filter(user_id),
+                search_params=self.profile.search_params(),
                 with_payload=True,
                 limit=top_k
             )
-
-            contexts = []
-            sources = set()
-
-            for r in results.points:
-                payload = getattr(r, "payload", None) or {}
-                text = payload.get("text", "")
-                source = payload.get("source", "")
-                if text:
-                    contexts.append(text)
-                    sources.add(source)
-
-            logger.debug(f"Found {len(contexts)} contexts from {len(sources)} sources")
-            return {"contexts": contexts, "sources": list(sources)}
+            return format_search_result([r.payload for r in results.points], [r.score for r in results.points])
 
         except Exception as e:
             logger.error(f"Search failed in collection '{self.collection}': {e}")
-            return {"contexts": [], "sources": []}
+            # The collection may have been dropped; re-check it on next use
+            self.invalidate()
+            return {"contexts": [], "sources": [], "hits": []}
+
+    def search_batch(self, query_vectors, top_k: int = 3, user_id: Optional[str] = None) -> list[dict]:
+        """Run one search per query vector in a single request; results come back in input order."""
+        if not query_vectors:
+            return []
+        try:
+            if not self._exists():
+                return _empty_results(len(query_vectors))
+            responses = self.client.query_batch_points(self.collection, requests=_batch_requests(query_vectors, top_k, user_id, self.profile.search_params()))
+            return _format_batch(responses)
+        except Exception as e:
+            logger.error(f"Batch search failed in collection '{self.collection}': {e}")
+            self.invalidate()
+            return _empty_results(len(query_vectors))
 
     def get_collection_info(self):
         """Get information about the collection."""
@@ -80,3 +409,159 @@ class QdrantStorage:
             return None
 
 
+class AsyncQdrantStorage:
+    """Async counterpart of QdrantStorage for use directly on the event loop."""
+
+    def __init__(self, url=QDRANT_URL, collection=QDRANT_COLLECTION, dim=1024, client=None, profile: Optional[CollectionProfile] = None):
+        self.client = client or get_async_qdrant_client(url)
+        self.url = url
+        self.collection = collection
+        self.dim = dim
+        # New collections are created with this profile; searches use its oversampling/rescoring
+        self.profile = profile or get_profile()
+        self._ensure_lock = asyncio.Lock()
+
+    async def ensure_collection(self):
+        key = (self.url, self.collection)
+        if key in _ready_collections:
+            return
+
+        async with self._ensure_lock:
+            if key in _ready_collections:
+                return
+            created = False
+            if not await self.client.collection_exists(self.collection):
+                logger.info(f"Creating new collection '{self.collection}' with dimension {self.dim}")
+                try:
+                    await self.client.create_collection(
+                        collection_name=self.collection,
+                        vectors_config=self.profile.vectors_config(self.dim),
+                        hnsw_config=self.profile.hnsw_config(),
+                        quantization_config=self.profile.quantization_config(),
+                    )
+                    created = True
+                except Exception:
+                    # Another worker process created it between the check and the create
+                    if not await self.client.collection_exists(self.collection):
+                        raise
+            if created:
+                missing = PAYLOAD_INDEXES
+            else:
+                info = await self.client.get_collection(self.collection)
+                _check_vectors_config(self.collection, info.config.params.vectors, self.dim)
+                missing = _missing_payload_indexes(info.payload_schema)
+            for field, params in missing.items():
+                await self.client.create_payload_index(self.collection, field, field_schema=params)
+            _ready_collections.add(key)
+
+    async def _exists(self) -> bool:
+        if (self.url, self.collection) in _ready_collections:
+            return True
+        if not await self.client.collection_exists(self.collection):
+            return False
+        await self.ensure_collection()
+        return True
+
+    def invalidate(self):
+        _ready_collections.discard((self.url, self.collection))
+
+    async def upsert(self, ids, vectors, payloads, wait: bool = UPSERT_WAIT):
+        await self.bulk_upsert(ids, vectors, payloads, wait=wait)
+
+    async def bulk_upsert(
+        self,
+        ids,
+        vectors,
+        payloads,
+        batch_size: int = UPSERT_BATCH_SIZE,
+        wait: bool = UPSERT_WAIT,
+    ):
+        batches = _point_batches(ids, vectors, payloads, batch_size)
+        await self.ensure_collection()
+        semaphore = asyncio.Semaphore(UPSERT_MAX_CONCURRENCY)
+
+        async def _send(index, points):
+            async with semaphore:
+                start = time.perf_counter()
+                await self.client.upsert(self.collection, points=points, wait=wait)
+                return {"batch": index, "points": len(points), "seconds": time.perf_counter() - start}
+
+        try:
+            timings = await asyncio.gather(*(_send(i, points) for i, points in enumerate(batches)))
+            bump_corpus_version()
+            logger.info(
+                f"Successfully upserted {len(ids)} points in {len(batches)} batches to collection '{self.collection}'"
+            )
+            return list(timings)
+        except Exception as e:
+            logger.error(f"Failed to upsert points to collection '{self.collection}': {e}")
+            self.invalidate()
+            raise
+
+    async def search(self, query_vector, top_k: int = 3, user_id: Optional[str] = None):
+        try:
+            if not await self._exists():
+                logger.warning(f"Collection '{self.collection}' does not exist, returning empty results")
+                return {"contexts": [], "sources": [], "hits": []}
+            results = await self.client.query_points(
+                collection_name=self.collection,
+                query=query_vector,
+                query_filter=user_filter(user_id),
+                search_params=self.profile.search_params(),
+                with_payload=True,
+                limit=top_k
+            )
+            return format_search_result([r.payload for r in results.points], [r.score for r in results.points])
+        except Exception as e:
+            logger.error(f"Search failed in collection '{self.collection}': {e}")
+            self.invalidate()
+            return {"contexts": [], "sources": [], "hits": []}
+
+    async def search_batch(self, query_vectors, top_k: int = 3, user_id: Optional[str] = None) -> list[dict]:
+        if not query_vectors:
+            return []
+        try:
+            if not await self._exists():
+                return _empty_results(len(query_vectors))
+            responses = await self.client.query_batch_points(
+                self.collection, requests=_batch_requests(query_vectors, top_k, user_id, self.profile.search_params())
+            )
+            return _format_batch(responses)
+        except Exception as e:
+            logger.error(f"Batch search failed in collection '{self.collection}': {e}")
+            self.invalidate()
+            return _empty_results(len(query_vectors))
+
+    async def get_collection_info(self):
+        try:
+            info = await self.client.get_collection(self.collection)
+            return {
+                "name": self.collection,
+                "vectors_count": info.points_count,
+                "vectors_config": info.config.params.vectors
+            }
+        except Exception as e:
+            logger.error(f"Failed to get collection info for '{self.collection}': {e}")
+            return None
+
+
+class _ThreadedAsyncStorage:
+    """Async facade over a synchronous backend that runs each call on the vector pool."""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    async def upsert(self, ids, vectors, payloads, wait: bool = UPSERT_WAIT):
+        await vector_executor.run(self.storage.upsert, ids, vectors, payloads, wait)
+
+    async def bulk_upsert(self, ids, vectors, payloads, batch_size: int = UPSERT_BATCH_SIZE, wait: bool = UPSERT_WAIT):
+        return await vector_executor.run(self.storage.bulk_upsert, ids, vectors, payloads, batch_size, wait)
+
+    async def search(self, query_vector, top_k: int = 3, user_id: Optional[str] = None):
+        return await vector_executor.run(self.storage.search, query_vector, top_k, user_id)
+
+    async def search_batch(self, query_vectors, top_k: int = 3, user_id: Optional[str] = None) -> list[dict]:
+        return await vector_executor.run(self.storage.search_batch, query_vectors, top_k, user_id)
+
+    async def get_collection_info(self):
+        return await vector_executor.run(self.storage.get_collection_info)
@@ -0,0 +1,9 @@
+class StaleElementsError(Exception):
+    """
+    Raised when a patch carries element versions older than the stored ones.
+    The merge itself runs in Postgres (scripts/002_patch_whiteboard_elements.sql).
+    """
+
+    def __init__(self, stale: list[dict]):
+        super().__init__(f"{len(stale)} element(s) are stale")
+        self.stale = stale
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# (whiteboard_id, user_id, token, update_data) -> number of rows written
+FlushFn = Callable[[str, str, str, dict], Awaitable[int]]
+
+
+class WriteBufferFlushError(Exception):
+    """A buffered write for a board could not be stored; it stays pending for a retry."""
+
+    def __init__(self, whiteboard_id: str, cause: Exception):
+        super().__init__(f"Saving whiteboard '{whiteboard_id}' failed: {cause}")
+        self.whiteboard_id = whiteboard_id
+
+
+@dataclass
+class _Pending:
+    user_id: str
+    token: str
+    data: dict
+    first_at: float
+    updates: int = 1
+    # Consecutive failed flushes and the earliest time the background loop retries
+    failures: int = 0
+    next_attempt_at: float = 0.0
+
+
+class WhiteboardWriteBuffer:
+    """
+    Write-behind buffer for whiteboard saves.
+
+    Updates to the same board are merged field by field (the latest value
+    wins) and written once the oldest pending update is `flush_interval_s`
+    old or `max_merged_saves` saves have been merged. Reads and deletes flush
+    or discard a board's pending write first, and `stop()` flushes everything.
+
+    A background flush that fails keeps the update pending and marks the
+    board as failing; the next submit or flush for it retries synchronously
+    and raises WriteBufferFlushError if the write still cannot be stored.
+    The background loop backs off exponentially, up to `max_backoff_s`,
+    between retries of a failing board.
+    """
+
+    def __init__(
+        self,
+        flush_fn: FlushFn,
+        flush_interval_s: float = 2.0,
+        max_merged_saves: int = 50,
+        max_backoff_s: float = 60.0,
+    ):
+        self.flush_fn = flush_fn
+        self.flush_interval_s = flush_interval_s
+        self.max_merged_saves = max_merged_saves
+        self.max_backoff_s = max_backoff_s
+        self._pending: dict[str, _Pending] = {}
+        self._failing: set[str] = set()
+        self._flush_locks: dict[str, asyncio.Lock] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.flushed = 0
+        self.flush_errors = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_all()
+
+    async def submit(self, whiteboard_id: str, user_id: str, token: str, update_data: dict) -> int:
+        """
+        Buffer an update; returns how many updates are now pending for the
+        board. Raises WriteBufferFlushError if an earlier write for the board
+        failed and still cannot be stored.
+        """
+        if whiteboard_id in self._failing:
+            await self.flush(whiteboard_id)
+        self.submitted += 1
+        pending = self._pending.get(whiteboard_id)
+        if pending is None or pending.user_id != user_id:
+            if pending is not None:
+                # A different user's write must not be merged into this one
+                await self._flush_quietly(whiteboard_id)
+            pending = _Pending(user_id=user_id, token=token, data=dict(update_data), first_at=time.monotonic())
+            self._pending[whiteboard_id] = pending
+        else:
+            pending.data.update(update_data)
+            pending.token = token
+            pending.updates += 1
+            self.coalesced += 1
+
+        if pending.updates >= self.max_merged_saves:
+            await self.flush(whiteboard_id)
+            return 0
+        return pending.updates
+
+    async def flush(self, whiteboard_id: str) -> bool:
+        """
+        Write a board's pending update now. Returns False if nothing was
+        pending; raises WriteBufferFlushError if the write failed.
+        """
+        lock = self._flush_locks.setdefault(whiteboard_id, asyncio.Lock())
+        async with lock:
+            pending = self._pending.pop(whiteboard_id, None)
+            if pending is None:
+                return False
+            try:
+                written = await self.flush_fn(whiteboard_id, pending.user_id, pending.token, pending.data)
+                self.flushed += 1
+                self._failing.discard(whiteboard_id)
+                if not written:
+                    # Board was deleted or is not the user's; retrying cannot help
+                    self.dropped += 1
+                    logger.warning(f"Buffered write for whiteboard '{whiteboard_id}' matched no rows")
+                return True
+            except Exception as e:
+                self.flush_errors += 1
+                self._failing.add(whiteboard_id)
+                pending.failures += 1
+                delay = min(self.max_backoff_s, self.flush_interval_s * 2 ** (pending.failures - 1))
+                pending.next_attempt_at = time.monotonic() + delay
+                logger.error(
+                    f"Failed to flush whiteboard '{whiteboard_id}' ({pending.failures} in a row, "
+                    f"next background retry in {delay:.1f}s): {e}"
+                )
+                # Put it back underneath anything submitted meanwhile so it is retried
+                newer = self._pending.get(whiteboard_id)
+                if newer is None:
+                    self._pending[whiteboard_id] = pending
+                elif newer.user_id == pending.user_id:
+                    newer.data = {**pending.data, **newer.data}
+                    newer.first_at = pending.first_at
+                    newer.failures = pending.failures
+                    newer.next_attempt_at = pending.next_attempt_at
+                raise WriteBufferFlushError(whiteboard_id, e) from e
+
+    def discard(self, whiteboard_id: str):
+        self._pending.pop(whiteboard_id, None)
+        self._failing.discard(whiteboard_id)
+        self._flush_locks.pop(whiteboard_id, None)
+
+    async def _flush_quietly(self, whiteboard_id: str):
+        # Failures are logged and counted by flush(); the update stays pending and
+        # the next request for the board retries it and reports the error
+        try:
+            await self.flush(whiteboard_id)
+        except WriteBufferFlushError:
+            pass
+
+    async def flush_all(self):
+        for whiteboard_id in list(self._pending):
+            await self._flush_quietly(whiteboard_id)
+
+    async def _run(self):
+        tick = max(self.flush_interval_s / 4, 0.05)
+        while True:
+            await asyncio.sleep(tick)
+            now = time.monotonic()
+            due = [
+                wid for wid, p in self._pending.items()
+                if now - p.first_at >= self.flush_interval_s and now >= p.next_attempt_at
+            ]
+            for whiteboard_id in due:
+                await self._flush_quietly(whiteboard_id)
+
+    def stats(self) -> dict:
+        return {
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "flushed": self.flushed,
+            "flush_errors": self.flush_errors,
+            "dropped": self.dropped,
+            "pending_boards": len(self._pending),
+            "failing_boards": len(self._failing),
+        }
@@ -52,3 +52,7 @@ create trigger on_whiteboard_updated
   before update on public.whiteboards
   for each row
   execute function public.handle_updated_at();
+
+-- Keyset pagination index for the dashboard listing: (user_id, updated_at desc, id desc)
+create index if not exists whiteboards_user_updated_idx
+  on public.whiteboards (user_id, updated_at desc, id desc);
@@ -0,0 +1,94 @@
+-- Element-level whiteboard patches merged inside Postgres.
+-- Only the elements array is read, and files are touched only when the patch adds some,
+-- so base64 image data never travels between the API and the database on a save.
+create or replace function public.patch_whiteboard_elements(
+  p_whiteboard_id uuid,
+  p_upserts jsonb default '[]'::jsonb,
+  p_deletes jsonb default '[]'::jsonb,
+  p_files jsonb default null,
+  p_app_state jsonb default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+  v_elements jsonb;
+  v_stale jsonb;
+begin
+  if exists (select 1 from jsonb_array_elements(p_upserts) u where coalesce(u->>'id', '') = '') then
+    return jsonb_build_object('status', 'invalid', 'message', 'Every upserted element needs an id');
+  end if;
+
+  -- The row lock serializes concurrent patches to one board, so no compare-and-set retry is needed
+  select coalesce(excalidraw_data->'elements', '[]'::jsonb)
+    into v_elements
+    from public.whiteboards
+   where id = p_whiteboard_id
+     and user_id = auth.uid()
+     for update;
+  if not found then
+    return jsonb_build_object('status', 'not_found');
+  end if;
+
+  -- An upsert must be newer than the stored element, or the same version and versionNonce (a retried save);
+  -- a delete must name a version at least as new as the stored one
+  select coalesce(jsonb_agg(jsonb_build_object('id', s.id, 'version', s.version)), '[]'::jsonb)
+    into v_stale
+    from (
+      select u->>'id' as id, coalesce((e->>'version')::numeric, 0) as version
+        from jsonb_array_elements(p_upserts) u
+        join jsonb_array_elements(v_elements) e on e->>'id' = u->>'id'
+       where coalesce((u->>'version')::numeric, 0) < coalesce((e->>'version')::numeric, 0)
+          or (coalesce((u->>'version')::numeric, 0) = coalesce((e->>'version')::numeric, 0)
+              and (u->'versionNonce') is distinct from (e->'versionNonce'))
+      union all
+      select d->>'id', coalesce((e->>'version')::numeric, 0)
+        from jsonb_array_elements(p_deletes) d
+        join jsonb_array_elements(v_elements) e on e->>'id' = d->>'id'
+       where coalesce((d->>'version')::numeric, 0) < coalesce((e->>'version')::numeric, 0)
+    ) s;
+  if jsonb_array_length(v_stale) > 0 then
+    return jsonb_build_object('status', 'stale', 'stale', v_stale);
+  end if;
+
+  -- Stored elements keep their order and are replaced in place; new ones are appended in patch order
+  with upserts as (
+    select distinct on (u->>'id') u->>'id' as id, u as el, first_value(ord) over (partition by u->>'id' order by ord) as pos
+      from jsonb_array_elements(p_upserts) with ordinality as t(u, ord)
+     order by u->>'id', ord desc
+  ),
+  stored as (
+    select e, ord from jsonb_array_elements(v_elements) with ordinality as t(e, ord)
+  ),
+  deleted as (
+    select d->>'id' as id from jsonb_array_elements(p_deletes) d where d->>'id' is not null
+  )
+  select coalesce(jsonb_agg(merged.el order by merged.appended, merged.pos), '[]'::jsonb)
+    into v_elements
+    from (
+      select coalesce(u.el, s.e) as el, false as appended, s.ord as pos
+        from stored s
+        left join upserts u on u.id = s.e->>'id'
+      union all
+      select u.el, true, u.pos
+        from upserts u
+       where not exists (select 1 from stored s where s.e->>'id' = u.id)
+    ) merged
+   where merged.el->>'id' is null
+      or merged.el->>'id' not in (select id from deleted);
+
+  update public.whiteboards
+     set excalidraw_data = jsonb_set(excalidraw_data, '{elements}', v_elements)
+       || case when p_files is null or p_files = '{}'::jsonb then '{}'::jsonb
+               else jsonb_build_object('files', coalesce(excalidraw_data->'files', '{}'::jsonb) || p_files) end
+       || case when p_app_state is null or p_app_state = '{}'::jsonb then '{}'::jsonb
+               else jsonb_build_object('appState', coalesce(excalidraw_data->'appState', '{}'::jsonb) || p_app_state) end
+   where id = p_whiteboard_id;
+
+  return jsonb_build_object('status', 'ok');
+end;
+$$;
+
+-- Runs with the caller's rights, so the RLS policies on whiteboards still apply
+revoke execute on function public.patch_whiteboard_elements(uuid, jsonb, jsonb, jsonb, jsonb) from public, anon;
+grant execute on function public.patch_whiteboard_elements(uuid, jsonb, jsonb, jsonb, jsonb) to authenticated;